@@ -0,0 +1,60 @@
+import numpy as np
+from pymodaq_plugins_qutools.hardware.controller import QuTAGController, \
+    MockQuTAGController
+from pymodaq_plugins_qutools.hardware.pairing import TriggerPairing
+from conftest import events_per_second
+
+
+def _demux_controller():
+    controller = QuTAGController()
+    for channel in (1, 2):
+        controller.callbacks[channel] = lambda tags, dt: None
+    controller.channel_zero_as_start[1] = True
+    return controller
+
+
+def bench_demux(benchmark, batch):
+    """Split a batch into per channel stores, channel 1 start relative."""
+
+    timestamps, channels = batch
+    controller = _demux_controller()
+
+    def demux():
+        controller._demux(timestamps, channels)
+        for buffer in controller.timestamps:
+            buffer.clear()
+
+    benchmark(demux)
+    events_per_second(benchmark, len(timestamps))
+
+
+def bench_ta_pairing(benchmark, batch):
+    """Pair triggers with the first excitation and probe events."""
+
+    timestamps, channels = batch
+    pairing = TriggerPairing(1, 2)
+
+    def pair():
+        pairing.reset()
+        return pairing.add(timestamps, channels)
+
+    benchmark(pair)
+    events_per_second(benchmark, len(timestamps))
+
+
+def bench_make_events(benchmark, batch_size):
+    """Poisson events at 1e8/s until batch_size events are expected."""
+
+    rate = 1e8
+    to_time = int(batch_size / (rate * MockQuTAGController.timebase))
+    benchmark(MockQuTAGController.make_events, 0, to_time, rate)
+    events_per_second(benchmark, batch_size)
+
+
+def bench_make_exp_events(benchmark, batch_size):
+    """Exponentially delayed events, about ten per trigger."""
+
+    triggers = np.arange(batch_size // 10, dtype=np.int64) * 10**6
+    rate = 10 / (10**6 * MockQuTAGController.timebase)
+    benchmark(MockQuTAGController.make_exp_events, triggers, rate, 1e-7)
+    events_per_second(benchmark, batch_size)
@@ -0,0 +1,40 @@
+import numpy as np
+from pymodaq_data.data import DataToExport, Axis
+from pymodaq.utils.data import DataFromPlugins
+from pymodaq_plugins_qutools.histogram import Histogram
+from conftest import events_per_second
+
+
+def bench_histogram_collect(benchmark, batch):
+    """Bin a batch into an existing 1000 bin histogram."""
+
+    timestamps, channels = batch
+    hist = Histogram(1000, timestamps[0], timestamps[-1])
+    benchmark(hist.collect, timestamps)
+    events_per_second(benchmark, len(timestamps))
+
+
+def bench_histogram_new(benchmark, batch):
+    """Set up a 1000 bin histogram from the range of a batch and fill it,
+    as the 1D viewer does per update."""
+
+    timestamps, channels = batch
+    benchmark(Histogram, 1000, timestamps)
+    events_per_second(benchmark, len(timestamps))
+
+
+def bench_emission(benchmark, batch):
+    """Histogram a batch and wrap it for export like the 1D viewer."""
+
+    timestamps, channels = batch
+
+    def emit():
+        hist = Histogram(1000, timestamps)
+        dfp = DataFromPlugins(name='qutag', data=[hist.bins.copy()],
+                              dim='Data1D', labels=['Ch 1'],
+                              axes=[Axis(data=hist.centers, label='',
+                                         units='', index=0)])
+        return DataToExport(name='qutag', data=[dfp])
+
+    benchmark(emit)
+    events_per_second(benchmark, len(timestamps))
@@ -0,0 +1,23 @@
+import subprocess, sys
+import pytest
+
+
+def _import(module):
+    subprocess.run([sys.executable, '-c', f'import {module}'], check=True)
+
+
+@pytest.mark.parametrize('module', [
+    'pymodaq_plugins_qutools.daq_viewer_plugins.plugins_0D',
+    'pymodaq_plugins_qutools.daq_viewer_plugins.plugins_1D',
+    'pymodaq_plugins_qutools.hardware.controller',
+    ])
+def bench_import(benchmark, module):
+    """Import time in a fresh interpreter, including its start up."""
+
+    benchmark.pedantic(_import, args=(module,), rounds=5)
+
+
+def bench_interpreter(benchmark):
+    """Interpreter start up alone, the baseline of bench_import."""
+
+    benchmark.pedantic(_import, args=('sys',), rounds=5)
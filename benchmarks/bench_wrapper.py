@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
+from pymodaq_plugins_qutools.hardware.tdc_emulation import TDCEmulation
+from conftest import events_per_second
+
+WRAPPER_BUFFER_SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+@pytest.fixture(params=WRAPPER_BUFFER_SIZES, ids=lambda n: f'{n:.0e}')
+def full_qutag(request):
+    """A QuTAG on the emulation finding a full buffer at every read."""
+
+    return QuTAG(buf_size=request.param,
+                 backend=TDCEmulation(1e6, real_time=False, seed=0))
+
+
+@pytest.fixture
+def idle_qutag():
+    """A QuTAG on the emulation without events, for the call overhead."""
+
+    return QuTAG(buf_size=1000, backend=TDCEmulation(0, seed=0))
+
+
+def bench_get_last_timestamps(benchmark, full_qutag):
+    """Read a full buffer, including its emulated generation."""
+
+    benchmark(full_qutag.getLastTimestampsInto, True)
+    events_per_second(benchmark, full_qutag._bufferSize)
+
+
+def bench_get_last_timestamps_overhead(benchmark, idle_qutag):
+    benchmark(idle_qutag.getLastTimestampsInto, True)
+
+
+def bench_get_histogram(benchmark, idle_qutag):
+    idle_qutag.enableStartStop(True)
+    idle_qutag.setHistogramParams(100, 4096)
+    idle_qutag.addHistogram(0, 1, True)
+    benchmark(idle_qutag.getHistogram, 0, 1, True)
+
+
+def bench_get_coinc_counters(benchmark, idle_qutag):
+    benchmark(idle_qutag.getCoincCounters)
+
+
+def bench_get_histogram_into(benchmark, idle_qutag):
+    """As bench_get_histogram, into a caller owned array."""
+
+    idle_qutag.enableStartStop(True)
+    idle_qutag.setHistogramParams(100, 4096)
+    idle_qutag.addHistogram(0, 1, True)
+    data = np.empty(4096, dtype=np.int32)
+    benchmark(idle_qutag.getHistogram, 0, 1, True, data)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+BATCH_SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+
+def make_batch(n, n_channels=2, trigger_fraction=0.01, seed=0):
+    """A time ordered batch of n int64 timestamps (ps) with their int8
+    channels: trigger_fraction on channel 0, the rest spread over channels
+    1 to n_channels."""
+
+    rng = np.random.default_rng(seed)
+    timestamps = np.cumsum(rng.exponential(1e4, n)).astype(np.int64)
+    channels = rng.integers(1, n_channels + 1, n).astype(np.int8)
+    channels[rng.random(n) < trigger_fraction] = 0
+    return timestamps, channels
+
+
+@pytest.fixture(params=BATCH_SIZES, ids=lambda n: f'{n:.0e}')
+def batch_size(request):
+    return request.param
+
+
+@pytest.fixture
+def batch(batch_size):
+    return make_batch(batch_size)
+
+
+def events_per_second(benchmark, n):
+    """Record the event count and throughput in the saved results."""
+
+    benchmark.extra_info['events'] = n
+    if benchmark.stats: # None with --benchmark-disable
+        benchmark.extra_info['events/s'] = n / benchmark.stats.stats.mean
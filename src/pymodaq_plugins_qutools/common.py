@@ -1,9 +1,14 @@
+import numpy as np
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, \
     comon_parameters
+from pymodaq.utils.data import DataFromPlugins
+from pymodaq_data.data import DataToExport
 from pymodaq_gui.parameter import Parameter
 from pymodaq_utils.utils import ThreadCommand
 from pymodaq_plugins_qutools.hardware.controller import QuTAGController, \
     MockQuTAGController, channel_settings
+from pymodaq_plugins_qutools.hardware.delivery import CallbackDispatcher
+from pymodaq_plugins_qutools.hardware.recorder import TimestampRecorder
 
 
 class QutagCommon(DAQ_Viewer_base):
@@ -13,6 +18,26 @@ class QutagCommon(DAQ_Viewer_base):
     params = comon_parameters + [
         { 'title': 'Update Interval [s]', 'name': 'update_interval',
           'type': 'float', 'value': 1 },
+        { 'title': 'Delivery Queue Size', 'name': 'delivery_queue_size',
+          'type': 'int', 'min': 1, 'value': 8 },
+        { 'title': 'Queue Overflow', 'name': 'delivery_policy', 'type': 'list',
+          'limits': CallbackDispatcher.POLICIES, 'value': 'coalesce' },
+        { 'title': 'Data Loss Check [s]', 'name': 'data_loss_interval',
+          'type': 'float', 'min': 0.01, 'value': 1 },
+        { 'title': 'Emit Diagnostics', 'name': 'diagnostics', 'type': 'bool',
+          'value': False },
+        { 'title': 'Stage Timing', 'name': 'stage_timing', 'type': 'bool',
+          'value': False },
+        { 'title': 'Buffer Size', 'name': 'buffer_size', 'type': 'int',
+          'min': 1, 'value': 1000 },
+        { 'title': 'Auto Buffer Size', 'name': 'auto_buffer_size',
+          'type': 'bool', 'value': False },
+        { 'title': 'Record File', 'name': 'record_path',
+          'type': 'browsepath', 'filetype': True, 'value': '' },
+        { 'title': 'Record Format', 'name': 'record_format', 'type': 'list',
+          'limits': TimestampRecorder.FORMATS, 'value': 'npy' },
+        { 'title': 'Record Timestamps', 'name': 'record', 'type': 'bool',
+          'value': False },
        ] + channel_settings
 
     live_mode_available = True
@@ -33,27 +58,38 @@ class QutagCommon(DAQ_Viewer_base):
             A given parameter (within detector_settings) whose value has been
             changed by the user
         """
-        if param.name() == "signal_cond":
-            self.controller.set_signal_conditioning(self._channel, param.value())
-        elif param.name() == "trigger_edge":
-            self.controller.set_trigger_edge(self._channel, param.value())
-        elif param.name() == "trigger_threshold":
-            self.controller.set_trigger_threshold(self._channel, param.value())
+        if param.name() in ("signal_cond", "trigger_edge",
+                            "trigger_threshold"):
+            # the device takes all three at once
+            self._configure_channel()
         elif param.name() == "update_interval":
             self.controller.update_intervals[self._channel] = param.value()
-        if param_name() == 'channel':
+        elif param.name() in ("delivery_queue_size", "delivery_policy"):
+            self._set_delivery()
+        elif param.name() == "data_loss_interval":
+            self.controller.set_data_loss_check_interval(param.value())
+        elif param.name() == "buffer_size":
+            self.controller.set_buffer_size(param.value())
+        elif param.name() == "auto_buffer_size":
+            self.controller.auto_buffer_size = param.value()
+        elif param.name() == "stage_timing":
+            self.controller.set_stage_timing(param.value())
+        elif param.name() == "record":
+            self._set_recording()
+        if param.name() == 'channel':
             self._channel_changed()
 
     def _channel_changed(self):
-        self.controller.set_signal_conditioning(self._channel,
-                                                self.settings['signal_cond'])
-        self.controller.set_trigger_edge(self._channel,
-                                         self.settings['trigger_edge'])
-        self.controller.set_trigger_threshold(self._channel,
-                                              self.settings['trigger_threshold'])
+        self._configure_channel()
         self.controller.update_intervals[self._channel] = \
             self.settings['update_interval']
 
+    def _configure_channel(self):
+        self.controller.configure_channel(self._channel,
+                                          self.settings['signal_cond'],
+                                          self.settings['trigger_edge'],
+                                          self.settings['trigger_threshold'])
+
     def ini_detector(self, controller=None):
         """Detector communication initialization
 
@@ -72,11 +108,18 @@ class QutagCommon(DAQ_Viewer_base):
 
         if self.is_master:
             self.controller = self.controller_type()
+            self.controller.buffer_size = self.settings['buffer_size']
             self.controller.open_communication()
             initialized = self.controller.initialised
         else:
             self.controller = controller
             initialized = True
+        self._set_delivery()
+        self.controller.set_data_loss_check_interval(
+            self.settings['data_loss_interval'])
+        self.controller.set_buffer_size(self.settings['buffer_size'])
+        self.controller.auto_buffer_size = self.settings['auto_buffer_size']
+        self.controller.set_stage_timing(self.settings['stage_timing'])
 
         info = "Connected to quTAG"
         return info, initialized
@@ -117,12 +160,41 @@ class QutagCommon(DAQ_Viewer_base):
 
     def close(self):
         """Terminate the communication protocol"""
+        self.controller.stop_recording()
         if self.is_master:
             self.controller.close_communication()
 
+    def _set_delivery(self):
+        self.controller.set_delivery(self.settings['delivery_queue_size'],
+                                     self.settings['delivery_policy'])
+
+    def _set_recording(self):
+        if not self.settings['record']:
+            self.controller.stop_recording()
+        elif self.settings['record_path']:
+            self.controller.start_recording(self.settings['record_path'],
+                                            self.settings['record_format'])
+        else:
+            self.emit_status(ThreadCommand('Update_Status',
+                                           ['No record file given']))
+            self.settings.child('record').setValue(False)
+
     def _set_params(self):
         pass
 
+    def _emit(self, data):
+        """Emit list of DataFromPlugins, adding the acquisition diagnostics
+        as 0D channel if asked for."""
+
+        if self.settings['diagnostics']:
+            diagnostics = self.controller.diagnostics()
+            data = data + [
+                DataFromPlugins(name='qutag diagnostics',
+                                data=[np.array([float(value)])
+                                      for value in diagnostics.values()],
+                                dim='Data0D', labels=list(diagnostics.keys()))]
+        self.dte_signal.emit(DataToExport(name='qutag', data=data))
+
     @property
     def _external_trigger(self):
         return False
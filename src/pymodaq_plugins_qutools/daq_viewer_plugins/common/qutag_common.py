@@ -131,7 +131,9 @@ class QutagCommon:
             self.controller = controller
             initialized = True
 
-        self.controller.qutag.enableChannels(True)
+        # one device write, the values below come from the controller's copy
+        # of the configuration read when connecting
+        self.controller.enable_all_channels()
         for channel in range(9):
             if channel:
                 settings_name = 'settings_ch%d' % channel
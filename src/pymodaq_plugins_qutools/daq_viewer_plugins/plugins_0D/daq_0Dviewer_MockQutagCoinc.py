@@ -0,0 +1,44 @@
+from pymodaq_gui.parameter import Parameter
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
+from pymodaq_plugins_qutools\
+    .daq_viewer_plugins.plugins_0D.daq_0Dviewer_QutagCoinc \
+    import DAQ_0DViewer_QutagCoinc
+
+
+class DAQ_0DViewer_MockQutagCoinc(DAQ_0DViewer_QutagCoinc):
+    """ Instrument plugin class for simulated quTAG hardware counters.
+    """
+
+    params = DAQ_0DViewer_QutagCoinc.params + [
+        { 'title': 'Rate [1/s]', 'name': 'rate', 'type': 'float', 'min': 1,
+          'value': 1e5 },
+        ]
+
+    controller_type = MockQuTAGController
+
+    def ini_attributes(self):
+        self.controller: MockQuTAGController = None
+        self.live = False
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() == "rate":
+            self.controller.rates[1:] = [param.value()] * 8
+        else:
+            super().commit_settings(param)
+
+    def _set_params(self):
+        self.controller.rates[1:] = [self.settings['rate']] * 8
+        super()._set_params()
+
+
+if __name__ == '__main__':
+    main(__file__)
@@ -1,5 +1,6 @@
 from pymodaq_gui.parameter import Parameter
 from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
 from pymodaq_plugins_qutools.daq_viewer_plugins.plugins_0D.\
     daq_0Dviewer_QutagStart import DAQ_0DViewer_QutagStart
 
@@ -0,0 +1,147 @@
+import numpy as np
+from pymodaq_gui.parameter import Parameter
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq.utils.data import DataFromPlugins
+from pymodaq_plugins_qutools.common import QutagCommon
+from pymodaq_plugins_qutools.hardware.controller import QuTAGController
+
+
+class DAQ_0DViewer_QutagCoinc(QutagCommon):
+    """ Instrument plugin class for a quTAG 0D viewer of the hardware
+    singles and coincidence counters.
+    """
+
+    params = [
+        { 'title': 'Channel', 'name': 'channel', 'type': 'int', 'min': 1,
+          'max': 8, 'value': 1 },
+        { 'title': 'Exposure Time [s]', 'name': 'exposure_time',
+          'type': 'float', 'min': 1e-3, 'max': 65, 'value': 0.1 },
+        { 'title': 'Coincidence Window [s]', 'name': 'coincidence_window',
+          'type': 'float', 'min': 1e-12, 'value': 1e-9 },
+        { 'title': 'Coincidences', 'name': 'coincidences', 'type': 'bool',
+          'value': True },
+        { 'title': 'Combinations', 'name': 'combinations', 'type': 'str',
+          'value': '', 'tip': "e.g. '1&2, 1&3&4', empty: all combinations "
+                              "of enabled channels" },
+        ] + QutagCommon.params
+
+    controller_type = QuTAGController
+
+    # the device counters: start, channels 1 - 8, coincidences
+    n_singles = 9
+    n_counters = 59
+
+    def ini_attributes(self):
+        self.controller: QuTAGController = None
+        self.live = False
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() in ("exposure_time", "coincidence_window",
+                            "coincidences", "combinations"):
+            pass # applied at the next start
+        else:
+            super().commit_settings(param)
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a grab from the detector
+
+        Parameters
+        ----------
+        Naverage: int
+            Number of hardware averaging (if hardware averaging is possible,
+            self.hardware_averaging should be set to
+            True in class preamble and you should code this implementation)
+        kwargs: dict
+            others optionals arguments
+        """
+        if 'live' in kwargs:
+            if kwargs['live']:
+                self._set_params()
+                self.live = True
+                self.controller.start_counters(
+                    self.settings['exposure_time'],
+                    self.settings['coincidence_window'], self.callback)
+            elif self.live:
+                self.live = False
+                self.controller.stop_histogram()
+
+    def callback(self, counters, exposure, dt):
+        rates = counters[self.counter_indices] / exposure
+        dfp = DataFromPlugins(name='qutag', data=[np.array([rate])
+                                                  for rate in rates],
+                              dim='Data0D', labels=self.counter_labels)
+        self._emit([dfp])
+
+    def stop(self):
+        """Stop the current grab hardware wise if necessary"""
+        self.controller.stop_histogram()
+        self.emit_status(ThreadCommand('Update_Status',
+                                       ['quTAG counters halted']))
+        return ''
+
+    def _set_params(self):
+        """Select the singles of the enabled inputs and, if asked for, the
+        coincidences given in combinations or, if none are given, those of
+        enabled inputs only. Where the device does not tell the order of
+        the coincidence counters, all of them are labelled by index."""
+
+        enabled = [channel for channel in range(self.n_singles)
+                   if self.controller.is_enabled(channel)]
+        self.counter_indices = list(enabled)
+        self.counter_labels = ['Start' if not channel else f'Ch {channel}'
+                               for channel in enabled]
+        if not self.settings['coincidences']:
+            return
+        combinations = self.controller.counter_combinations()
+        if combinations is None:
+            if self.settings['combinations'].strip():
+                self.emit_status(ThreadCommand(
+                    'Update_Status',
+                    ['Coincidence counter order unknown, showing all']))
+            indices = range(self.n_singles, self.n_counters)
+            self.counter_indices += indices
+            self.counter_labels += [f'Counter {index}' for index in indices]
+            return
+        selected = self._selected_combinations(combinations)
+        for index, combo in enumerate(combinations):
+            if selected is None and not set(combo) <= set(enabled) \
+               or selected is not None and combo not in selected:
+                continue
+            self.counter_indices.append(self.n_singles + index)
+            self.counter_labels.append('&'.join(map(str, combo)))
+
+    def _selected_combinations(self, combinations):
+        """Combinations given as '1&2, 1&3&4', None if empty."""
+
+        text = self.settings['combinations'].strip()
+        if not text:
+            return None
+        selected = set()
+        for item in text.split(','):
+            try:
+                combo = tuple(sorted(int(channel)
+                                     for channel in item.split('&')))
+            except ValueError:
+                combo = None
+            if combo not in combinations:
+                self.emit_status(ThreadCommand(
+                    'Update_Status',
+                    [f'No coincidence counter for {item.strip()}']))
+                continue
+            selected.add(combo)
+        return selected
+
+
+if __name__ == '__main__':
+    from PyQt6.QtCore import pyqtRemoveInputHook
+    pyqtRemoveInputHook() # to be able to use pdb inside Qt's event loops
+    main(__file__)
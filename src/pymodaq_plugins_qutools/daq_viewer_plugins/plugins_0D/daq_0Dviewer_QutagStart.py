@@ -22,7 +22,7 @@ class DAQ_0DViewer_QutagStart(QutagCommon):
         rate = len(tags) / dt
         dfp = DataFromPlugins(name='qutag', data=[np.array([rate])],
                               dim='Data0D', labels=[f'Start'])
-        self.dte_signal.emit(DataToExport(name='qutag', data=[dfp]))
+        self._emit([dfp])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,48 @@
+from pymodaq_gui.parameter import Parameter
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
+from pymodaq_plugins_qutools.daq_viewer_plugins.plugins_1D.daq_1Dviewer_QutagHBT \
+    import DAQ_1DViewer_QutagHBT
+
+
+class DAQ_1DViewer_MockHBTQutag(DAQ_1DViewer_QutagHBT):
+    """ Instrument plugin class for a simulated quTAG HBT viewer.
+    """
+
+    params = DAQ_1DViewer_QutagHBT.params + [
+        { 'title': 'Rate [1/s]', 'name': 'rate', 'type': 'float', 'min': 1,
+          'value': 1e6 },
+        { 'title': 'Lifetime [s]', 'name': 'lifetime', 'type': 'float',
+          'min': 0, 'value': 2e-9 },
+        ]
+
+    controller_type = MockQuTAGController
+
+    def ini_attributes(self):
+        self.controller: MockQuTAGController = None
+        self.live = False
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() in ("rate", "lifetime"):
+            self._set_params()
+        else:
+            super().commit_settings(param)
+
+    def _set_params(self):
+        super()._set_params()
+        channel2 = self.settings['channel2']
+        self.controller.rates[self._channel] = self.settings['rate']
+        self.controller.rates[channel2] = self.settings['rate']
+        self.controller.lifetimes[channel2] = self.settings['lifetime']
+
+
+if __name__ == '__main__':
+    main(__file__)
@@ -2,6 +2,7 @@ import numpy as np
 from pymodaq_data.data import DataToExport, Axis
 from pymodaq_gui.parameter import Parameter
 from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_utils.utils import ThreadCommand
 from pymodaq.utils.data import DataFromPlugins
 from pymodaq_plugins_qutools.hardware.controller import QuTAGController
 from pymodaq_plugins_qutools.common import QutagCommon
@@ -17,20 +18,144 @@ class DAQ_1DViewer_Qutag(QutagCommon):
           'max': 8, 'value': 1 },
         { 'title': 'Histogram bins', 'name': 'n_bins', 'type': 'int',
           'min': 2, 'value': 100 },
+        { 'title': 'Accumulate', 'name': 'accumulate', 'type': 'bool',
+          'value': False },
+        { 'title': 'Acquisition Mode', 'name': 'acquisition_mode',
+          'type': 'list', 'limits': ['Timestamps', 'Hardware Histogram',
+                                     'Hardware Lifetime'],
+          'value': 'Timestamps' },
+        { 'title': 'Start Channel', 'name': 'start_channel', 'type': 'int',
+          'min': 0, 'max': 8, 'value': 0 },
+        { 'title': 'Bin Width [s]', 'name': 'bin_width', 'type': 'float',
+          'min': 1e-12, 'value': 1e-9 },
+        { 'title': 'Lifetime Fit', 'name': 'lifetime_fit', 'type': 'list',
+          'limits': QuTAGController.lifetime_fits, 'value': 'None' },
         ] + QutagCommon.params
 
     controller_type = QuTAGController
 
+    def ini_detector(self, controller=None):
+        info, initialized = super().ini_detector(controller)
+        if initialized and not self.controller.has_feature('lifetime'):
+            # e.g. the emulation backend
+            mode = self.settings.child('acquisition_mode')
+            mode.setLimits([limit for limit in mode.opts['limits']
+                            if limit != 'Hardware Lifetime'])
+        return info, initialized
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() in ("n_bins", "accumulate"):
+            self._set_params()
+        elif param.name() in ("acquisition_mode", "start_channel",
+                              "bin_width", "lifetime_fit"):
+            pass # applied at the next start
+        else:
+            super().commit_settings(param)
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a grab from the detector
+
+        Parameters
+        ----------
+        Naverage: int
+            Number of hardware averaging (if hardware averaging is possible,
+            self.hardware_averaging should be set to
+            True in class preamble and you should code this implementation)
+        kwargs: dict
+            others optionals arguments
+        """
+        mode = self.settings['acquisition_mode']
+        if mode == 'Timestamps':
+            return super().grab_data(Naverage, **kwargs)
+
+        if 'live' in kwargs:
+            if kwargs['live']:
+                self._set_params()
+                self.live = True
+                if mode == 'Hardware Lifetime':
+                    self.controller.start_lifetime(
+                        self.settings['start_channel'], self._channel,
+                        self.settings['bin_width'], self.n_bins,
+                        self.controller.lifetime_fits.index(
+                            self.settings['lifetime_fit']),
+                        self.lifetime_callback,
+                        self.settings['update_interval'])
+                else:
+                    self.controller.start_histogram(
+                        self.settings['start_channel'], self._channel,
+                        self.settings['bin_width'], self.n_bins,
+                        self.histogram_callback,
+                        self.settings['update_interval'])
+            elif self.live:
+                self.live = False
+                self.controller.stop_histogram()
+
+    def stop(self):
+        """Stop the current grab hardware wise if necessary"""
+        self.controller.stop_histogram()
+        self.controller.stop(self._channel)
+        self.emit_status(ThreadCommand('Update_Status', ['quTAG rate halted']))
+        return ''
+
     def callback(self, tags, dt):
-        hist = Histogram(self.n_bins, tags)
-        dfp = DataFromPlugins(name='qutag', data=hist.bins, dim='Data1D',
-                              labels=[f'Ch {self._channel}'],
-                              axes=[Axis(data=hist.centers, label='',
-                                         units='', index=0)])
-        self.dte_signal.emit(DataToExport(name='qutag', data=[dfp]))
+        if not len(tags) and (self.hist is None or not self.accumulate):
+            return # nothing to bin, e.g. a replay past its end
+        if self.hist is None or not self.accumulate:
+            self.hist = Histogram(self.n_bins, tags)
+        elif len(tags):
+            # later tags lie beyond the range of the first frame
+            self.hist.include(tags.min(), tags.max())
+            self.hist.collect(tags)
+        hist = self.hist
+        # tags are int64 in units of the device timebase, only the bin
+        # centers are converted
+        dfp = DataFromPlugins(name='qutag', data=hist.bins.copy(),
+                              dim='Data1D', labels=[f'Ch {self._channel}'],
+                              axes=[Axis(data=hist.centers
+                                         * self.controller.timebase,
+                                         label='time', units='s', index=0)])
+        self._emit([dfp])
+
+    def histogram_callback(self, counts, dt):
+        if self.counts is None or not self.accumulate \
+           or len(self.counts) != len(counts):
+            self.counts = counts.astype(float)
+        else:
+            self.counts += counts
+        self._emit([self._delay_data(self.counts.copy())])
+
+    def lifetime_callback(self, curve, fit_params, dt):
+        data = [self._delay_data(curve)]
+        if fit_params is not None:
+            data.append(DataFromPlugins(
+                name='qutag fit', data=[np.array([value])
+                                        for value in fit_params],
+                dim='Data0D',
+                labels=[f'p{i}' for i in range(len(fit_params))]))
+        self._emit(data)
+
+    def _delay_data(self, counts):
+        # the device bins are whole multiples of its timebase
+        bin_width = self.controller.histogram_bin_width
+        centers = (np.arange(len(counts)) + 0.5) * bin_width
+        return DataFromPlugins(name='qutag', data=counts, dim='Data1D',
+                               labels=[f'Ch {self._channel}'],
+                               axes=[Axis(data=centers, label='delay',
+                                          units='s', index=0)])
 
     def _set_params(self):
         self.n_bins = self.settings['n_bins']
+        self.accumulate = self.settings['accumulate']
+        self.hist = None
+        self.counts = None
 
 
 if __name__ == '__main__':
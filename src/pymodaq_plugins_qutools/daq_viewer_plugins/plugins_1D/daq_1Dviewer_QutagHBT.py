@@ -0,0 +1,107 @@
+import numpy as np
+from pymodaq_data.data import Axis
+from pymodaq_gui.parameter import Parameter
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_utils.utils import ThreadCommand
+from pymodaq.utils.data import DataFromPlugins
+from pymodaq_plugins_qutools.hardware.controller import QuTAGController
+from pymodaq_plugins_qutools.common import QutagCommon
+
+
+class DAQ_1DViewer_QutagHBT(QutagCommon):
+    """ Instrument plugin class for a quTAG 1D viewer of the g2 function
+    measured by the on-board HBT correlator.
+    """
+
+    params = [
+        { 'title': 'Channel', 'name': 'channel', 'type': 'int', 'min': 1,
+          'max': 8, 'value': 1 },
+        { 'title': 'Second Channel', 'name': 'channel2', 'type': 'int',
+          'min': 1, 'max': 8, 'value': 2 },
+        { 'title': 'Bins per Side', 'name': 'n_bins', 'type': 'int',
+          'min': 2, 'value': 100 },
+        { 'title': 'Bin Width [s]', 'name': 'bin_width', 'type': 'float',
+          'min': 1e-12, 'value': 1e-10 },
+        { 'title': 'g2 Fit', 'name': 'hbt_fit', 'type': 'list',
+          'limits': QuTAGController.hbt_fits, 'value': 'None' },
+        ] + QutagCommon.params
+
+    controller_type = QuTAGController
+
+    def ini_attributes(self):
+        self.controller: QuTAGController = None
+        self.live = False
+
+    def ini_detector(self, controller=None):
+        info, initialized = super().ini_detector(controller)
+        if initialized and not self.controller.has_feature('hbt'):
+            # e.g. the emulation backend
+            return "quTAG has no HBT feature", False
+        return info, initialized
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() in ("channel2", "n_bins", "bin_width", "hbt_fit"):
+            pass # applied at the next start
+        else:
+            super().commit_settings(param)
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Start a grab from the detector
+
+        Parameters
+        ----------
+        Naverage: int
+            Number of hardware averaging (if hardware averaging is possible,
+            self.hardware_averaging should be set to
+            True in class preamble and you should code this implementation)
+        kwargs: dict
+            others optionals arguments
+        """
+        if 'live' in kwargs:
+            if kwargs['live']:
+                self._set_params()
+                self.live = True
+                self.controller.start_hbt(
+                    self._channel, self.settings['channel2'],
+                    self.settings['bin_width'], self.settings['n_bins'],
+                    self.controller.hbt_fits.index(self.settings['hbt_fit']),
+                    self.callback, self.settings['update_interval'])
+            elif self.live:
+                self.live = False
+                self.controller.stop_histogram()
+
+    def callback(self, g2, fit_params, dt):
+        n_bins = (len(g2) + 1) // 2
+        delays = np.arange(1 - n_bins, n_bins) \
+            * self.controller.histogram_bin_width
+        data = [DataFromPlugins(name='qutag', data=g2, dim='Data1D',
+                                labels=['g2'],
+                                axes=[Axis(data=delays, label='delay',
+                                           units='s', index=0)])]
+        if fit_params is not None:
+            data.append(DataFromPlugins(
+                name='qutag fit', data=[np.array([value])
+                                        for value in fit_params],
+                dim='Data0D',
+                labels=[f'p{i}' for i in range(len(fit_params))]))
+        self._emit(data)
+
+    def stop(self):
+        """Stop the current grab hardware wise if necessary"""
+        self.controller.stop_histogram()
+        self.emit_status(ThreadCommand('Update_Status', ['quTAG HBT halted']))
+        return ''
+
+
+if __name__ == '__main__':
+    from PyQt6.QtCore import pyqtRemoveInputHook
+    pyqtRemoveInputHook() # to be able to use pdb inside Qt's event loops
+    main(__file__)
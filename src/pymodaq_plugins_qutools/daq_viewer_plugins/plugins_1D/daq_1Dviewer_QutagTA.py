@@ -20,6 +20,8 @@ class DAQ_1DViewer_QutagTA(QutagCommon):
           'min': 1, 'max': 8, 'value': 2 },
         { 'title': 'Histogram bins', 'name': 'n_bins', 'type': 'int',
           'min': 2, 'value': 100 },
+        { 'title': 'Pairing Window [s]', 'name': 'pairing_window',
+          'type': 'float', 'min': 0, 'value': 0 },
        ] + QutagCommon.params
 
     controller_type = TAQuTAGController
@@ -44,6 +46,8 @@ class DAQ_1DViewer_QutagTA(QutagCommon):
             if kwargs['live']:
                 self._set_params()
                 self.live = True
+                self.controller.set_pairing_window(
+                    self.settings['pairing_window'])
                 self.controller.start(self.settings['excitation'],
                                       self.settings['probe'], self.callback,
                                       self.settings['update_interval'])
@@ -55,23 +59,22 @@ class DAQ_1DViewer_QutagTA(QutagCommon):
         n_bins = self.settings['n_bins']
         hist_ps = Histogram(n_bins, excitation)
         hist_fs = Histogram(n_bins, probe)
-        hist_diff = Histogram(n_bins, [p - e for p,e in zip(excitation, probe)])
+        hist_diff = Histogram(n_bins, excitation - probe)
 
-        excitation_data = DataFromPlugins(name='qutag', data=hist_ps.bins,
-                                          dim='Data1D', labels=['ch 0'],
-                                          axes=[Axis(data=hist_ps.centers,
-                                                   label='', units='', index=0)])
-        probe_data = DataFromPlugins(name='qutag', data=hist_fs.bins,
-                                     dim='Data1D', labels=['ch 1'],
-                                     axes=[Axis(data=hist_fs.centers,
-                                                label='', units='', index=0)])
-        diff_data = DataFromPlugins(name='qutag', data=hist_diff.bins,
-                                    dim='Data1D', labels=['difference'],
-                                    axes=[Axis(data=hist_diff.centers,
-                                               label='', units='', index=0)])
-        self.dte_signal.emit(DataToExport(name='qutag',
-                                          data=[excitation_data, probe_data,
-                                                diff_data]))
+        excitation_data = self._delay_data(hist_ps, 'ch 0')
+        probe_data = self._delay_data(hist_fs, 'ch 1')
+        diff_data = self._delay_data(hist_diff, 'difference')
+        self._emit([excitation_data, probe_data, diff_data])
+
+    def _delay_data(self, hist, label):
+        """Delays are int64 in units of the device timebase, only the bin
+        centers are converted to seconds."""
+
+        return DataFromPlugins(name='qutag', data=hist.bins, dim='Data1D',
+                               labels=[label],
+                               axes=[Axis(data=hist.centers
+                                          * self.controller.timebase,
+                                          label='delay', units='s', index=0)])
 
     def stop(self):
         """Stop the current grab hardware wise if necessary"""
@@ -0,0 +1,75 @@
+from pymodaq_gui.parameter import Parameter
+from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq_plugins_qutools.hardware.controller import ReplayQuTAGController
+from pymodaq_plugins_qutools.daq_viewer_plugins.plugins_1D.daq_1Dviewer_Qutag \
+    import DAQ_1DViewer_Qutag
+
+
+class DAQ_1DViewer_ReplayQutag(DAQ_1DViewer_Qutag):
+    """ Instrument plugin class replaying recorded quTAG timestamps.
+    """
+
+    # recordings hold timestamps only, the hardware modes need a device
+    params = [dict(param, limits=['Timestamps'], value='Timestamps')
+              if param['name'] == 'acquisition_mode' else param
+              for param in DAQ_1DViewer_Qutag.params
+              if param['name'] not in ('start_channel', 'bin_width',
+                                       'lifetime_fit')] + [
+        { 'title': 'Replay File', 'name': 'replay_path',
+          'type': 'browsepath', 'filetype': True, 'value': '' },
+        { 'title': 'Real Time', 'name': 'real_time', 'type': 'bool',
+          'value': True },
+        { 'title': 'Loop', 'name': 'loop', 'type': 'bool', 'value': False },
+        { 'title': 'Seek [s]', 'name': 'seek', 'type': 'float', 'min': 0,
+          'value': 0 },
+        { 'title': 'Relative to Start', 'name': 'zero_as_start',
+          'type': 'bool', 'value': False },
+        ]
+
+    controller_type = ReplayQuTAGController
+
+    def ini_attributes(self):
+        self.controller: ReplayQuTAGController = None
+        self.live = False
+
+    def ini_detector(self, controller=None):
+        info, initialized = super().ini_detector(controller)
+        self._open_file()
+        return info, initialized
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been
+            changed by the user
+        """
+        if param.name() == "replay_path":
+            self._open_file()
+        elif param.name() == "real_time":
+            self.controller.real_time = param.value()
+        elif param.name() == "loop":
+            self.controller.loop = param.value()
+        elif param.name() == "seek":
+            self.controller.seek(param.value())
+        elif param.name() == "zero_as_start":
+            pass # applied at the next start
+        else:
+            super().commit_settings(param)
+
+    def _open_file(self):
+        self.controller.real_time = self.settings['real_time']
+        self.controller.loop = self.settings['loop']
+        if self.settings['replay_path']:
+            self.controller.open_file(str(self.settings['replay_path']))
+            self.controller.seek(self.settings['seek'])
+
+    @property
+    def _external_trigger(self):
+        return self.settings['zero_as_start']
+
+
+if __name__ == '__main__':
+    main(__file__)
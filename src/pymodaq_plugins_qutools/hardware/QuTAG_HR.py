@@ -53,7 +53,7 @@ class QuTAG:
             ('capacity',ctypes.c_int32),
             ('size',ctypes.c_int32),
             ('binWidth',ctypes.c_int32),
-            ('values',ctypes.c_double)]
+            ('values',ctypes.c_double)] # BL, first of capacity values, see getLFTFunctionValues
     
     # hbt histogram structure
     class TDC_HbtFunction(ctypes.Structure):
@@ -62,22 +62,27 @@ class QuTAG:
             ('size',ctypes.c_int32),
             ('binWidth',ctypes.c_int32),
             ('indexOffset',ctypes.c_int32),
-            ('values',ctypes.c_double)]
+            ('values',ctypes.c_double)] # BL, first of capacity values, see getHBTFunctionValues
             
-    def __init__(self, buf_size=None): # BL, def __init__(self):
+    def __init__(self, buf_size=None, backend=None, library_path=None): # BL, def __init__(self):
         """Initializing the quTAG MC \n\n
         Checking the bit version of Python to load the corresponding DLL \n
         Loading 32 or 64 bit DLL: make sure the wrapper finds the matching DLL
         in the same folder  \n
         Declary API  \n
         Connect the device by the function QuTAG.Initialize()  \n
-        Set some parameters
+        Set some parameters \n
+        BL: backend replaces the library by an object providing the TDC_*
+        functions, e.g. tdc_emulation.TDCEmulation. library_path is the full
+        path of libtdcbase.so, by default it is searched by the loader.
         """
         file_path = os.path.dirname(os.path.abspath(__file__))
-        if os.name == 'posix':
+        if backend is not None: # BL
+            self.qutools_dll = backend
+        elif os.name == 'posix':
             dll_name = 'libtdcbase.so'
 #            os.environ['PATH'] += ':/home/bernhard/lab/qutag/lib'
-            self.qutools_dll = ctypes.cdll.LoadLibrary('/home/bernhard/lab/qutag/lib/libtdcbase.so')
+            self.qutools_dll = ctypes.cdll.LoadLibrary(library_path or dll_name) # BL, was '/home/bernhard/lab/qutag/lib/libtdcbase.so'
         else:
             dll_name = 'tdcbase.dll'
             # check Python bit version
@@ -116,6 +121,8 @@ class QuTAG:
         
         self._HBTBufferSize = 256
         self._LFTBufferSize = 256
+        self._resultBuffers = {} # BL, output arrays reused between calls
+        self._resultScalars = {} # BL, output scalars reused between calls
 
     def __declareAPI(self):
         """Declare the API of the DLL. Should not be executed from the user."""
@@ -328,6 +335,7 @@ class QuTAG:
         self.FCTTYPE_THERM_JIT_OFS = 11
         self.FCTTYPE_SINGLE_JIT_OFS = 12
         self.FCTTYPE_ANTIB_JIT_OFS = 13
+        self.HBT_PARAM_SIZE = 5 # BL, was used but not defined
         # ----------------------------------------------------
         # function definitions 
         self.qutools_dll.TDC_enableHbt.argtypes = [ctypes.c_int32]
@@ -356,7 +364,7 @@ class QuTAG:
         self.qutools_dll.TDC_calcHbtG2.restype = ctypes.c_int32
         self.qutools_dll.TDC_fitHbtG2.argtypes = [ctypes.POINTER(QuTAG.TDC_HbtFunction),ctypes.c_int32,ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_int32)]
         self.qutools_dll.TDC_fitHbtG2.restype = ctypes.c_int32
-        self.qutools_dll.TDC_getHbtFitStartParams.argtypes = [ctypes.c_int32,ctypes.POINTER(ctypes.c_double)]
+        self.qutools_dll.TDC_getHbtFitStartParams.argtypes = [ctypes.c_int32,ctypes.POINTER(QuTAG.TDC_HbtFunction)] # BL, was POINTER(c_double)
         self.qutools_dll.TDC_getHbtFitStartParams.restype = ctypes.POINTER(ctypes.c_double)
         self.qutools_dll.TDC_calcHbtModelFct.argtypes = [ctypes.c_int32,ctypes.POINTER(ctypes.c_double),ctypes.POINTER(QuTAG.TDC_HbtFunction)]
         self.qutools_dll.TDC_calcHbtModelFct.restype = ctypes.c_int32
@@ -409,7 +417,7 @@ class QuTAG:
         self.qutools_dll.TDC_calcLftModelFct.restype = ctypes.c_int32
         self.qutools_dll.TDC_generateLftDemo.argtypes = [ctypes.c_int32,ctypes.POINTER(ctypes.c_double),ctypes.c_double]
         self.qutools_dll.TDC_generateLftDemo.restype = ctypes.c_int32
-        self.qutools_dll.TDC_fitLftHistogram.argtypes = [ctypes.POINTER(ctypes.c_double),ctypes.c_int32,ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_int32)]
+        self.qutools_dll.TDC_fitLftHistogram.argtypes = [ctypes.POINTER(QuTAG.TDC_LftFunction),ctypes.c_int32,ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_double),ctypes.POINTER(ctypes.c_int32)] # BL, was POINTER(c_double)
         self.qutools_dll.TDC_fitLftHistogram.restype = ctypes.c_int32
         
 # Init --------------------------------------------------------------    
@@ -716,6 +724,7 @@ class QuTAG:
     
     def setBufferSize(self, size):
         self._bufferSize = size
+        self._timestampBuffers = None # BL, reallocated on next use
         ans = self.qutools_dll.TDC_setTimestampBufferSize(size)
         if ans != 0:
             print("Error in TDC_setTimestampBufferSize: "+self.err_dict[ans])
@@ -750,6 +759,83 @@ class QuTAG:
             print("Error in TDC_getLastTimestamps: "+self.err_dict[ans])
             
         return (timestamps,channels, valid.value)
+
+    def getLastTimestampsInto(self, reset, timestamps=None, channels=None): # BL
+        """Like getLastTimestamps, but fill timestamps and channels in place
+        instead of allocating and zeroing new arrays. Both must be contiguous
+        int64/int8 arrays holding at least the buffer size. If omitted, two
+        wrapper owned buffer pairs are used alternately, so the result of
+        the previous call stays intact.
+        Returns views (timestamps[:valid], channels[:valid], valid)."""
+        if timestamps is None or channels is None:
+            timestamps, channels = self._nextTimestampBuffers()
+        elif len(timestamps) < self._bufferSize \
+             or len(channels) < self._bufferSize \
+             or timestamps.dtype != np.int64 or channels.dtype != np.int8 \
+             or not timestamps.flags.c_contiguous \
+             or not channels.flags.c_contiguous:
+            raise ValueError("getLastTimestampsInto needs contiguous int64 "
+                             "and int8 arrays of at least %d entries"
+                             % self._bufferSize)
+        valid = ctypes.c_int32()
+
+        ans = self.qutools_dll.TDC_getLastTimestamps(reset,timestamps.ctypes.data_as(ctypes.POINTER(ctypes.c_int64)),channels.ctypes.data_as(ctypes.POINTER(ctypes.c_int8)),ctypes.byref(valid))
+        if ans != 0: # "never fails"
+            print("Error in TDC_getLastTimestamps: "+self.err_dict[ans])
+
+        return (timestamps[:valid.value], channels[:valid.value], valid.value)
+
+    def _nextTimestampBuffers(self): # BL
+        """Return the wrapper owned buffer pair not handed out last time."""
+        if self._timestampBuffers is None:
+            size = int(self._bufferSize)
+            self._timestampBuffers = \
+                [(np.empty(size, dtype=np.int64), np.empty(size, dtype=np.int8))
+                 for _ in range(2)]
+            self._timestampBufferIndex = 0
+        self._timestampBufferIndex ^= 1
+        return self._timestampBuffers[self._timestampBufferIndex]
+
+    def _resultBuffer(self, name, size, dtype, ctype, data=None): # BL
+        """Return an output array of size entries and a ctypes pointer to
+        it: the leading entries of data, which must be a contiguous array of
+        dtype with at least size entries, or a wrapper owned array
+        reallocated only when size changes."""
+        if data is not None:
+            if len(data) < size or data.dtype != dtype \
+               or not data.flags.c_contiguous:
+                raise ValueError("%s needs a contiguous %s array of at least "
+                                 "%d entries" % (name, np.dtype(dtype), size))
+            return data[:size], data.ctypes.data_as(ctypes.POINTER(ctype))
+        buffer = self._resultBuffers.get(name)
+        if buffer is None or len(buffer[0]) != size:
+            array = np.zeros(size, dtype=dtype)
+            buffer = (array, array.ctypes.data_as(ctypes.POINTER(ctype)))
+            self._resultBuffers[name] = buffer
+        return buffer
+
+    @staticmethod
+    def _functionValues(function): # BL
+        """The values field of the function structs is the first element of
+        an array of capacity doubles, view size of them in place."""
+        function = function.contents
+        if function.size > function.capacity:
+            raise ValueError("function size %d exceeds its capacity %d"
+                             % (function.size, function.capacity))
+        address = ctypes.addressof(function) + type(function).values.offset
+        return np.ctypeslib.as_array(
+            ctypes.cast(address, ctypes.POINTER(ctypes.c_double)),
+            (function.size,))
+
+    def _resultScalar(self, name, *types): # BL
+        """Return wrapper owned output scalars of types and pointers to
+        them, created on first use."""
+        scalars = self._resultScalars.get(name)
+        if scalars is None:
+            values = [ctype() for ctype in types]
+            scalars = (values, [ctypes.pointer(value) for value in values])
+            self._resultScalars[name] = scalars
+        return scalars
     
 # File IO -------------------------------------------
     def writeTimestamps(self, filename, fileformat):
@@ -773,10 +859,12 @@ class QuTAG:
         return ans
         
 # Counting --------------------------------------------
-    def getCoincCounters(self):
-        data = np.zeros(int(59),dtype=np.int32)
-        update = ctypes.c_int32()
-        ans = self.qutools_dll.TDC_getCoincCounters(data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),ctypes.byref(update))
+    def getCoincCounters(self, data=None): # BL, def getCoincCounters(self):
+        """BL: the counters are written to data, if given, else to a wrapper
+        owned array which is overwritten by the next call."""
+        data, dataPtr = self._resultBuffer('getCoincCounters', 59, np.int32, ctypes.c_int32, data) # BL, was allocated per call
+        (update,), (updatePtr,) = self._resultScalar('getCoincCounters', ctypes.c_int32)
+        ans = self.qutools_dll.TDC_getCoincCounters(dataPtr,updatePtr)
         if ans != 0: # "never fails"
             print("Error in TDC_getCoincCounters: "+self.err_dict[ans])
         return (data,update.value)
@@ -826,19 +914,16 @@ class QuTAG:
             print("Error in TDC_clearAllHistograms: "+self.err_dict[ans])
         return ans
         
-    def getHistogram(self, chanA, chanB, reset):
+    def getHistogram(self, chanA, chanB, reset, data=None): # BL, def getHistogram(self, chanA, chanB, reset):
+        """BL: the counts are written to data, if given, else to a wrapper
+        owned array of the bin count which is overwritten by the next call."""
         if reset:
             reset_value = 1
         else:
             reset_value = 0
-        data = np.zeros(self._StartStopBinCount, dtype=np.int32)
-        count = ctypes.c_int32()
-        tooSmall = ctypes.c_int32()
-        tooLarge = ctypes.c_int32()
-        starts = ctypes.c_int32()
-        stops = ctypes.c_int32()
-        expTime = ctypes.c_int64()
-        ans = self.qutools_dll.TDC_getHistogram(chanA,chanB,reset_value,data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),ctypes.byref(count),ctypes.byref(tooSmall),ctypes.byref(tooLarge),ctypes.byref(starts),ctypes.byref(stops),ctypes.byref(expTime))
+        data, dataPtr = self._resultBuffer('getHistogram', self._StartStopBinCount, np.int32, ctypes.c_int32, data) # BL, was allocated per call
+        (count, tooSmall, tooLarge, starts, stops, expTime), pointers = self._resultScalar('getHistogram', *(5 * [ctypes.c_int32]), ctypes.c_int64)
+        ans = self.qutools_dll.TDC_getHistogram(chanA,chanB,reset_value,dataPtr,*pointers)
         if ans != 0:
             print("Error in TDC_getHistogram: "+self.err_dict[ans])
         
@@ -897,6 +982,11 @@ class QuTAG:
         self.qutools_dll.TDC_releaseLftFunction(LFTfunction)
         return 0
 
+    def getLFTFunctionValues(self, lft): # BL
+        """BL: numpy view of the size values of lft, no copy. Valid until
+        the function is filled again or released."""
+        return self._functionValues(lft)
+
     def addLFTHistogram(self,stopchannel,enable):
         if enable:
             ena = 1
@@ -908,27 +998,23 @@ class QuTAG:
             print("Error in TDC_addLftHistogram: "+self.err_dict[ans])
         return ans
         
-    def analyseLFTFunction(self,lft):
-        capacity = ctypes.c_int32()
-        size = ctypes.c_int32()
-        binWidth = ctypes.c_int32()
-        values = np.zeros(self._LFTBufferSize, dtype=np.double)
+    def analyseLFTFunction(self,lft,values=None): # BL, def analyseLFTFunction(self,lft):
+        """BL: the curve is written to values, if given, else to a wrapper
+        owned array of the bin count which is overwritten by the next call."""
+        values, valuesPtr = self._resultBuffer('analyseLFTFunction', self._LFTBufferSize, np.double, ctypes.c_double, values) # BL, was allocated per call
+        (capacity, size, binWidth), pointers = self._resultScalar('analyseLFTFunction', *(3 * [ctypes.c_int32]))
         
-        self.qutools_dll.TDC_analyseLftFunction (lft, ctypes.byref(capacity), ctypes.byref(size), ctypes.byref(binWidth), values.ctypes.data_as(ctypes.POINTER(ctypes.c_double)), self._LFTBufferSize)
+        self.qutools_dll.TDC_analyseLftFunction (lft, *pointers, valuesPtr, self._LFTBufferSize)
         return (capacity.value, size.value, binWidth.value, values)
 
     def getLFTHistogram(self,channel,reset, lft):
-        print("getLFTHistogram")
-        tooBig = ctypes.c_int32()
-        startevt = ctypes.c_int32()
-        stopevt = ctypes.c_int32()
-        expTime = ctypes.c_int64()
+        (tooBig, startevt, stopevt, expTime), pointers = self._resultScalar('getLFTHistogram', *(3 * [ctypes.c_int32]), ctypes.c_int64) # BL, were allocated per call
         if reset:
             resetvalue = 1
         else:
             resetvalue = 0
             
-        ans = self.qutools_dll.TDC_getLftHistogram(channel, resetvalue, lft, ctypes.byref(tooBig), ctypes.byref(startevt), ctypes.byref(stopevt), ctypes.byref(expTime))
+        ans = self.qutools_dll.TDC_getLftHistogram(channel, resetvalue, lft, *pointers)
         if ans != 0:
             print("Error in TDC_getLFTHistogram: "+self.err_dict[ans])
         return (lft, tooBig.value, startevt.value, stopevt.value, expTime.value)
@@ -1076,11 +1162,13 @@ class QuTAG:
             print("Error in TDC_fitHbtG2: "+self.err_dict[ans])
         return (fitParams,iterations.value)
     
-    def getHBTFitStartParams(self, fctType):
+    def getHBTFitStartParams(self, fctType, hbtfunction): # BL, def getHBTFitStartParams(self, fctType):
         fitParams = np.zeros(self.HBT_PARAM_SIZE,dtype=np.double)
-        ans = self.qutools_dll.TDC_getHbtFitStartParams(fctType, fitParams.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
-        if ans != 0:
-            print("Error in TDC_getHbtFitStartParams: "+self.err_dict[ans])
+        ans = self.qutools_dll.TDC_getHbtFitStartParams(fctType, hbtfunction) # BL, returns the parameters
+        if not ans:
+            print("Error in TDC_getHbtFitStartParams")
+            return fitParams
+        fitParams[:] = ans[:self.HBT_PARAM_SIZE]
         return fitParams
     
     def calcHBTModelFct(self, fctType, params, hbtfunction):
@@ -1113,13 +1201,18 @@ class QuTAG:
     def releaseHBTFunction(self, hbtfunction):
         self.qutools_dll.TDC_releaseHbtFunction(hbtfunction)
         return 0
+
+    def getHBTFunctionValues(self, hbtfunction): # BL
+        """BL: numpy view of the size values of hbtfunction, no copy. Valid
+        until the function is filled again or released."""
+        return self._functionValues(hbtfunction)
     
-    def analyzeHBTFunction(self, hbtfunction):
-        capacity = ctypes.c_int32()
-        size = ctypes.c_int32()
-        binWidth = ctypes.c_int32()
-        iOffset = ctypes.c_int32()
-        values = np.zeros(self._HBTBufferSize,dtype=np.double)
-        self.qutools_dll.TDC_analyseHbtFunction(hbtfunction,ctypes.byref(capacity),ctypes.byref(size),ctypes.byref(binWidth),ctypes.byref(iOffset),values.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),self._HBTBufferSize)
+    def analyzeHBTFunction(self, hbtfunction, values=None): # BL, def analyzeHBTFunction(self, hbtfunction):
+        """BL: the function values are written to values, if given, else to
+        a wrapper owned array of 2 * bin count - 1 entries which is
+        overwritten by the next call."""
+        values, valuesPtr = self._resultBuffer('analyzeHBTFunction', self._HBTBufferSize, np.double, ctypes.c_double, values) # BL, was allocated per call
+        (capacity, size, binWidth, iOffset), pointers = self._resultScalar('analyzeHBTFunction', *(4 * [ctypes.c_int32]))
+        self.qutools_dll.TDC_analyseHbtFunction(hbtfunction,*pointers,valuesPtr,self._HBTBufferSize)
         
         return (capacity.value,size.value,binWidth.value,iOffset.value,values)
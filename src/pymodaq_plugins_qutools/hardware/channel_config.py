@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+
+
+class ChannelConfiguration:
+    """Shadow copy of the quTAG channel configuration: enabled inputs and
+    signal conditioning of the start input (channel 0) and the stop inputs
+    1 - 8.
+
+    read() fetches the device state in one pass, afterwards the getters are
+    served from the copy. Setters change the copy and write only what has
+    changed, at once or, within a deferred() block, in one apply() at its
+    end. Without a device (qutag None) only the copy is kept.
+
+    The device does not report the conditioning type, it stays at the last
+    value set, 'Misc' initially, the default of the viewer settings. It is
+    written together with edge and threshold. Conditionings and edges are
+    given by value or by their names in conditionings and edges."""
+
+    channel_count = 9
+    conditionings = { 'LVTTL': 1, 'NIM': 2, 'Misc': 3 }
+    edges = { 'Rising': True, 'Falling': False }
+
+    def __init__(self, qutag=None):
+        self.qutag = qutag
+        self.enabled = [True for _ in range(self.channel_count)]
+        self.conditioning = [self.conditionings['Misc']
+                             for _ in range(self.channel_count)]
+        self.edge = [True for _ in range(self.channel_count)]
+        self.threshold = [0.0 for _ in range(self.channel_count)]
+        self._enabled_changed = False
+        self._changed_channels = set()
+        self._deferred = 0
+
+    def read(self):
+        """Replace the copy by the device state, discarding unapplied
+        changes."""
+
+        self._enabled_changed = False
+        self._changed_channels.clear()
+        if self.qutag is None:
+            return
+        start_enabled, enabled_channels = self.qutag.getChannelsEnabled()
+        mask = int(enabled_channels or '0', 2)
+        self.enabled[0] = bool(start_enabled)
+        for channel in range(1, self.channel_count):
+            self.enabled[channel] = bool(mask & 1 << (channel - 1))
+        for channel in range(self.channel_count):
+            self.edge[channel], self.threshold[channel] = \
+                self.qutag.getSignalConditioning(channel)
+
+    @contextmanager
+    def deferred(self):
+        """Collect the changes made in the with block into one apply()."""
+
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if not self._deferred:
+                self.apply()
+
+    def apply(self):
+        """Write the changed items to the device."""
+
+        if self.qutag is None:
+            self._enabled_changed = False
+            self._changed_channels.clear()
+            return
+        if self._enabled_changed:
+            self._enabled_changed = False
+            self.qutag.enableChannels(self.enabled[0], self.enabled_channels)
+        while self._changed_channels:
+            channel = self._changed_channels.pop()
+            self.qutag.setSignalConditioning(channel,
+                                             self.conditioning[channel],
+                                             self.edge[channel],
+                                             self.threshold[channel])
+
+    @property
+    def enabled_channels(self):
+        """Enabled stop inputs as bit string, channel 8 first."""
+
+        return ''.join('1' if enabled else '0'
+                       for enabled in reversed(self.enabled[1:]))
+
+    def is_enabled(self, channel):
+        return self.enabled[channel]
+
+    def set_enabled(self, channel, enable):
+        enable = bool(enable)
+        if self.enabled[channel] == enable:
+            return
+        self.enabled[channel] = enable
+        self._enabled_changed = True
+        self._changed()
+
+    def set_conditioning(self, channel, conditioning):
+        self._set(self.conditioning, channel,
+                  self.conditionings.get(conditioning, conditioning))
+
+    def set_edge(self, channel, edge):
+        self._set(self.edge, channel, bool(self.edges.get(edge, edge)))
+
+    def set_threshold(self, channel, threshold):
+        self._set(self.threshold, channel, float(threshold))
+
+    def conditioning_name(self, channel):
+        return self._name(self.conditionings, self.conditioning[channel])
+
+    def edge_name(self, channel):
+        return self._name(self.edges, self.edge[channel])
+
+    def _set(self, values, channel, value):
+        if values[channel] == value:
+            return
+        values[channel] = value
+        self._changed_channels.add(channel)
+        self._changed()
+
+    def _changed(self):
+        if not self._deferred:
+            self.apply()
+
+    @staticmethod
+    def _name(names, value):
+        for name, named_value in names.items():
+            if named_value == value:
+                return name
+        return value
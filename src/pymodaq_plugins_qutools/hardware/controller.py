@@ -1,37 +1,199 @@
-import ctypes, random, time
+import ctypes, os, time
+from abc import ABC, abstractmethod
+from itertools import combinations
 import numpy as np
-from threading import Thread, Lock
-from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
+from threading import Thread, Lock, Event
+from pymodaq_utils.logger import set_logger, get_module_name
+from pymodaq_plugins_qutools import config
+from pymodaq_plugins_qutools.timestamp_buffer import TimestampBuffer
+from pymodaq_plugins_qutools.hardware.poll_scheduler import PollScheduler
+from pymodaq_plugins_qutools.hardware.channel_config import \
+    ChannelConfiguration
+from pymodaq_plugins_qutools.hardware.delivery import CallbackDispatcher, \
+    merge_frames, add_frames, newest_frame
+from pymodaq_plugins_qutools.hardware.diagnostics import \
+    AcquisitionStatistics, StageTimer
+from pymodaq_plugins_qutools.hardware.pairing import TriggerPairing
+from pymodaq_plugins_qutools.hardware.recorder import TimestampRecorder, \
+    npy_base
 
 
 channel_settings = [
     { 'title': 'Signal Conditioning', 'name': 'signal_cond', 'type': 'list',
-      'limits': ['LVTTL', 'NIM', 'Misc'] },
+      'limits': ['LVTTL', 'NIM', 'Misc'], 'value': 'Misc' },
     { 'title': 'Trigger Edge', 'name': 'trigger_edge', 'type': 'list',
       'limits': ['Rising', 'Falling'] },
     { 'title': 'Trigger Threshold', 'name': 'trigger_threshold',
       'type': 'float', 'min': -2, 'max': 3 },
 ]
 
+logger = set_logger(get_module_name(__file__))
 
-class QuTAGController:
+
+def coincidence_combinations(n_channels=8, n_counters=50):
+    """Input combinations of the quTAG coincidence counters, in the order
+    documented for TDC_getCoincCounters, following the start and single
+    counters: the pairs, triples, ... of stop inputs, each size ordered by
+    its highest, then next highest input (1&2, 1&3, 2&3, 1&4, ...)."""
+
+    combos = []
+    for size in range(2, n_channels + 1):
+        combos += sorted(combinations(range(1, n_channels + 1), size),
+                         key=lambda combo: combo[::-1])
+    return combos[:n_counters]
+
+
+def qutag_options(backend=None):
+    """Keyword arguments of QuTAG for backend or, if None, for the backend
+    chosen in the plugin configuration: the library at qutag.library_path
+    or, with qutag.emulate, the in-process emulation."""
+
+    if backend is None and config('qutag', 'emulate'):
+        from pymodaq_plugins_qutools.hardware.tdc_emulation import \
+            TDCEmulation
+        backend = TDCEmulation(config('qutag', 'emulation_rate'))
+    if backend is not None:
+        return { 'backend': backend }
+    return { 'library_path': config('qutag', 'library_path') or None }
+
+
+class BaseQuTAGController(ABC):
+    """Device connection, channel configuration, timestamp polling,
+    recording and callback delivery shared by the quTAG controllers. The
+    subclasses add their acquisition threads."""
+
+    timebase = 1e-12 # s, replaced by the device value when connected
+    timestamp_dtype = np.int64
+    max_stored_events = 2**24 # per channel, oldest events are dropped beyond
+    min_buffer_size = 1000
+    max_buffer_size = 2**24
+    timed_stages = ['read', 'record', 'submit', 'latency', 'callback']
 
     def __init__(self):
         self.initialised = False
         self.thread = None
-        self.update_intervals = [None for _ in range(9)]
-        self.last_updates = [None for _ in range(9)]
-        self.next_updates = [None for _ in range(9)]
-        self.callbacks = [None for _ in range(9)]
-        self.timestamps = [[] for _ in range(9)]
-        self.last_channel_zero = 0
-        self.active_channels = 0
-        self.channel_zero_as_start = [False for _ in range(9)]
         self.mutex = Lock()
+        self.buffer_size = 1000
+        self.auto_buffer_size = False
+        self._requested_buffer_size = None
+        self.poll_scheduler = PollScheduler(self.buffer_size)
+        self.dispatcher = CallbackDispatcher()
+        self.acquisition_statistics = AcquisitionStatistics(self.buffer_size)
+        self.stage_timer = StageTimer(self.timed_stages)
+        self.dispatcher.timer = self.stage_timer
+        self.recorder = None
+        self.backend = None # None: as configured, see qutag_options
+        self.channel_config = ChannelConfiguration()
+
+    @property
+    def poll_period(self):
+        """Currently chosen time between two device polls in seconds."""
+        return self.poll_scheduler.period
+
+    def set_delivery(self, queue_size, policy):
+        """Configure the queue between acquisition thread and callbacks."""
+
+        self.dispatcher.max_size = queue_size
+        self.dispatcher.policy = policy
+
+    def delivery_statistics(self):
+        """Return counters of queued, dropped, coalesced, delivered and late
+        callback frames."""
+
+        return self.dispatcher.statistics()
+
+    def set_data_loss_check_interval(self, interval):
+        self.acquisition_statistics.check_interval = interval
+
+    def set_stage_timing(self, enable):
+        """Switch timing of the acquisition stages on or off, starting with
+        empty timings."""
+
+        self.stage_timer.reset()
+        self.stage_timer.enabled = enable
+
+    def stage_timing(self):
+        """Return mean and maximum duration per acquisition stage."""
+
+        return self.stage_timer.summary()
+
+    def start_recording(self, path, format='npy'):
+        """Write the raw timestamps and channels of every poll to path in
+        format 'npy' or 'hdf5' (needs h5py), while acquiring."""
+
+        self.stop_recording()
+        self.recorder = TimestampRecorder(path, format, self.timebase)
+
+    def stop_recording(self):
+        """Finish writing and close the recording files."""
+
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def set_buffer_size(self, size):
+        """Set the device timestamp buffer size. While acquiring, the change
+        is applied by the acquisition thread before its next poll."""
+
+        with self.mutex:
+            if self.thread is None:
+                self._apply_buffer_size(size)
+            else:
+                self._requested_buffer_size = size
+
+    def _apply_buffer_size(self, size):
+        self._requested_buffer_size = None
+        self.buffer_size = int(size)
+        self.poll_scheduler.buffer_size = self.buffer_size
+        self.acquisition_statistics.buffer_size = self.buffer_size
+        if self.initialised:
+            self._set_device_buffer_size(self.buffer_size)
+        logger.info(f"quTAG timestamp buffer size set to {self.buffer_size}, "
+                    f"last fill ratio "
+                    f"{self.acquisition_statistics.window_fill:.3f}")
+
+    def _auto_size_buffer(self):
+        """Size the buffer to hold the events of the longest poll period at
+        the target fill, rounded to a power of two. Only changes by more
+        than a factor of two are applied."""
+
+        rate = self.acquisition_statistics.events_per_second
+        needed = rate * self.poll_scheduler.max_period \
+            / self.poll_scheduler.target_fill
+        size = 2**int(np.ceil(np.log2(max(needed, self.min_buffer_size))))
+        size = min(size, self.max_buffer_size)
+        if size >= 2 * self.buffer_size or 2 * size <= self.buffer_size:
+            self._apply_buffer_size(size)
+
+    def _set_device_buffer_size(self, size):
+        self.qutag.setBufferSize(size)
+
+    def diagnostics(self):
+        """Return counters of the current acquisition session. The stage
+        timings are NaN while stage timing is off, so that the entries stay
+        the same."""
+
+        diagnostics = self.acquisition_statistics.summary()
+        diagnostics['poll period'] = self.poll_period
+        delivery = self.delivery_statistics()
+        diagnostics['dropped frames'] = delivery['dropped']
+        diagnostics['late frames'] = delivery['late']
+        timing = self.stage_timing()
+        if not self.stage_timer.enabled:
+            timing = dict.fromkeys(timing, np.nan)
+        diagnostics.update(timing)
+        return diagnostics
 
     def open_communication(self):
+        # imported here, so that listing the plugins does not load the
+        # device library wrapper
+        from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
         try:
-            self.qutag = QuTAG(buf_size=1000)
+            self.qutag = QuTAG(buf_size=self.buffer_size,
+                               **qutag_options(self.backend))
+            self.timebase = self.qutag.getTimebase()
+            self.channel_config.qutag = self.qutag
+            self.channel_config.read()
             self.initialised = True
         except:
             raise RuntimeError("Couldn't initialise QuTAG")
@@ -40,29 +202,141 @@ class QuTAGController:
         if self.initialised:
             self.stop_tagging()
             self.qutag.deInitialize()
+            self.channel_config.qutag = None
             self.initialised = False
 
+    def has_feature(self, feature):
+        """True if the device supports 'lifetime' or 'hbt' analysis. The
+        emulation backend supports neither."""
+
+        if not self.initialised:
+            return False
+        if feature == 'lifetime':
+            return self.qutag._featureLifetime
+        return self.qutag._featureHBT
+
     def is_enabled(self, channel):
         """Return True if channel is enabled.
         0: start, 1:-8 normal channels."""
 
-        start_enabled, enabled_channels = self.enabled_channels
-        if channel:
-            return enabled_channels[8 - channel] == '1'
-        return start_enabled
+        return self.channel_config.is_enabled(channel)
 
     def enable_channel(self, channel, enable):
         """Enable or disable channel.
         0: start, 1:-8 normal channels."""
 
-        start_enabled, enabled_channels = self.get_enabled_channels()
+        self.channel_config.set_enabled(channel, enable)
 
-        if channel:
-            enabled_channels = \
-              replace_char(enabled_channels, 8 - channel, '1' if enable else '0')
-        else:
-            start_enabled = enable
-        self.qutag.enableChannels(start_enabled, enabled_channels)
+    def get_signal_conditioning(self, channel):
+        return self.channel_config.conditioning_name(channel)
+
+    def set_signal_conditioning(self, channel, conditioning):
+        self.channel_config.set_conditioning(channel, conditioning)
+
+    def get_trigger_edge(self, channel):
+        return self.channel_config.edge_name(channel)
+
+    def set_trigger_edge(self, channel, edge):
+        self.channel_config.set_edge(channel, edge)
+
+    def get_trigger_threshold(self, channel):
+        return self.channel_config.threshold[channel]
+
+    def set_trigger_threshold(self, channel, threshold):
+        self.channel_config.set_threshold(channel, threshold)
+
+    def configure_channel(self, channel, conditioning, edge, threshold):
+        """Set the signal conditioning of channel with one device write.
+        Items given as None are left as they are."""
+
+        with self.channel_config.deferred():
+            if conditioning is not None:
+                self.set_signal_conditioning(channel, conditioning)
+            if edge is not None:
+                self.set_trigger_edge(channel, edge)
+            if threshold is not None:
+                self.set_trigger_threshold(channel, threshold)
+
+    @abstractmethod
+    def stop_tagging(self):
+        """Stop all acquisitions."""
+
+    def _poll(self):
+        """Read a batch of events, apply a requested buffer size before and
+        update poll scheduling, statistics and recording after. Returns the
+        valid timestamps and channels, the poll time and the stage timer
+        mark."""
+
+        if self._requested_buffer_size is not None:
+            self._apply_buffer_size(self._requested_buffer_size)
+        timer = self.stage_timer
+        mark = timer.mark()
+        timestamps, channels, valid = self._get_time_stamps()
+        mark = timer.lap('read', mark)
+        now = time.time()
+        self.poll_scheduler.update(valid, now)
+        self._update_statistics(valid, now)
+        timestamps, channels = timestamps[:valid], channels[:valid]
+        self._record(timestamps, channels)
+        mark = timer.lap('record', mark)
+        return timestamps, channels, now, mark
+
+    def _record(self, timestamps, channels):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(timestamps, channels)
+
+    def _update_statistics(self, valid, now):
+        self.acquisition_statistics.add_batch(valid)
+        if self.acquisition_statistics.check_due(now):
+            self.acquisition_statistics.add_check(self._get_data_lost(), now)
+            if self.auto_buffer_size:
+                self._auto_size_buffer()
+
+    def _get_data_lost(self):
+        return self.qutag.getDataLost()
+
+    def _get_time_stamps(self):
+        """Read time stamps from device.
+        Returns tuple (timestamps, channels, valid)."""
+
+        return self.qutag.getLastTimestampsInto(reset=True)
+
+
+class QuTAGController(BaseQuTAGController):
+
+    timed_stages = ['read', 'record', 'demux', 'submit', 'latency', 'callback']
+    lifetime_fits = ['None', 'Exponential', 'Double Exponential',
+                     'Kohlrausch'] # device LFT model types 0 - 3
+    hbt_fits = ['None', 'Coherent', 'Thermal', 'Single', 'Antibunching',
+                'Thermal Jitter', 'Single Jitter', 'Antibunching Jitter',
+                'Thermal Offset', 'Single Offset', 'Antibunching Offset',
+                'Thermal Jitter Offset', 'Single Jitter Offset',
+                'Antibunching Jitter Offset'] # device HBT model types 0 - 13
+
+    def __init__(self):
+        super().__init__()
+        self.update_intervals = [None for _ in range(9)]
+        self.last_updates = [None for _ in range(9)]
+        self.next_updates = [None for _ in range(9)]
+        self.callbacks = [None for _ in range(9)]
+        self.timestamps = \
+            [TimestampBuffer(self.max_stored_events, dtype=self.timestamp_dtype)
+             for _ in range(9)]
+        self.last_channel_zero = 0
+        self.active_channels = 0
+        self.channel_zero_as_start = [False for _ in range(9)]
+        self.histogram_thread = None
+        self.histogram_callback = None
+        self.histogram_channels = None
+        self.histogram_mode = None
+        self.histogram_bin_width = None # s, as applied by the device
+        self._histogram_stop = Event()
+
+    def stop_tagging(self):
+        self.stop_histogram()
+        for channel in range(9):
+            self.stop(channel)
 
     def start_rate_zero(self, callback, update_interval):
         self._start(0, callback, False, update_interval)
@@ -79,17 +353,18 @@ class QuTAGController:
         assert self.callbacks[channel] is None
 
         self.update_intervals[channel] = update_interval
-        self.timestamps[channel] = []
+        self.timestamps[channel].clear()
         now = time.time()
         self.last_updates[channel] = now
         self.next_updates[channel] = now + update_interval
 
         self.callbacks[channel] = callback
-        self.enable_channel(channel, True)
-        if channel:
-            self.channel_zero_as_start[channel] = channel_zero_as_start
-            if channel_zero_as_start:
-                self.enable_channel(0, True)
+        with self.channel_config.deferred():
+            self.enable_channel(channel, True)
+            if channel:
+                self.channel_zero_as_start[channel] = channel_zero_as_start
+                if channel_zero_as_start:
+                    self.enable_channel(0, True)
         self._start_loop()
         
     def stop(self, channel):
@@ -104,10 +379,140 @@ class QuTAGController:
         self.callbacks[channel] = None
         self.next_updates[channel] = None
 
+    def start_histogram(self, start_channel, stop_channel, bin_width,
+                        bin_count, callback, update_interval):
+        """Let the device histogram the delays from start_channel to
+        stop_channel events (start-stop mode) with bin_width in seconds.
+        Every update_interval, callback receives the bin counts accumulated
+        since the last call and the elapsed time."""
+
+        self._start_device_histogram('start-stop', start_channel, stop_channel,
+                                     bin_width, bin_count, callback,
+                                     update_interval)
+
+    def start_lifetime(self, start_channel, stop_channel, bin_width,
+                       bin_count, fit_type, callback, update_interval):
+        """Let the device accumulate the lifetime histogram of stop_channel
+        events after start_channel events with bin_width in seconds, and
+        fit the model fit_type (index into lifetime_fits, 0: no fit) to it.
+        Every update_interval, callback receives the accumulated curve, the
+        fit parameters (None without fit) and the elapsed time."""
+
+        self.lifetime_fit = fit_type
+        self.lifetime_params = None
+        self._start_device_histogram('lifetime', start_channel, stop_channel,
+                                     bin_width, bin_count, callback,
+                                     update_interval)
+
+    def start_hbt(self, channel1, channel2, bin_width, bin_count, fit_type,
+                  callback, update_interval):
+        """Let the device correlator accumulate the g2 function between
+        channel1 and channel2 over delays of -bin_count to bin_count bins of
+        bin_width seconds, and fit the model fit_type (index into hbt_fits,
+        0: no fit) to it. Every update_interval, callback receives the
+        2 * bin_count - 1 values of g2, the fit parameters (None without
+        fit) and the elapsed time."""
+
+        self.hbt_fit = fit_type
+        self.hbt_params = None
+        self._start_device_histogram('hbt', channel1, channel2, bin_width,
+                                     bin_count, callback, update_interval)
+
+    def start_counters(self, exposure_time, coincidence_window, callback):
+        """Let the device count the events of all inputs and their
+        coincidences within coincidence_window seconds over exposure_time
+        seconds. After every exposure, callback receives the array of
+        counters (start, channels 1 - 8, coincidences, see
+        counter_combinations), the exposure time in seconds they cover and
+        the elapsed time. Queued frames are added up, counts and exposure
+        times alike."""
+
+        if not self.initialised:
+            return
+        assert self.histogram_callback is None
+
+        self.histogram_channels = None
+        self._set_up_counters(
+            max(int(round(exposure_time * 1000)), 1),
+            max(int(round(coincidence_window / self.timebase)), 1))
+        # poll twice per exposure, the device tells if there are new counts
+        self._start_histogram_thread('counters', callback, exposure_time / 2)
+
+    def counter_combinations(self):
+        """Input combinations of the coincidence counters in the order of
+        the counters array, None if it is not known for the device type."""
+
+        if self.qutag.getDeviceType() != self.qutag.DEVTYPE_QUTAG:
+            return None
+        return coincidence_combinations()
+
+    def _start_device_histogram(self, mode, start_channel, stop_channel,
+                                bin_width, bin_count, callback,
+                                update_interval):
+        if not self.initialised:
+            return
+        assert self.histogram_callback is None
+        if mode in ('lifetime', 'hbt') and not self.has_feature(mode):
+            raise RuntimeError(f"quTAG {mode} feature not available")
+
+        self.histogram_channels = (start_channel, stop_channel)
+        with self.channel_config.deferred():
+            self.enable_channel(start_channel, True)
+            self.enable_channel(stop_channel, True)
+        bin_width = max(int(round(bin_width / self.timebase)), 1)
+        self.histogram_bin_width = bin_width * self.timebase
+        if mode == 'lifetime':
+            self._set_up_lifetime(start_channel, stop_channel, bin_width,
+                                  bin_count)
+        elif mode == 'hbt':
+            self._set_up_hbt(start_channel, stop_channel, bin_width,
+                             bin_count)
+        else:
+            self._set_up_histogram(start_channel, stop_channel, bin_width,
+                                   bin_count)
+        self._start_histogram_thread(mode, callback, update_interval)
+
+    def _start_histogram_thread(self, mode, callback, update_interval):
+        self.histogram_mode = mode
+        self.histogram_callback = callback
+        self.histogram_interval = update_interval
+        with self.mutex:
+            self.dispatcher.start()
+            self._histogram_stop.clear()
+            self.histogram_thread = Thread(target=self._histogram_loop)
+            self.histogram_thread.start()
+
+    def stop_histogram(self):
+        """Stop device histogramming or counting started with
+        start_histogram, start_lifetime, start_hbt or start_counters."""
+
+        if self.histogram_callback is None:
+            return
+
+        with self.mutex:
+            self._histogram_stop.set()
+            self.histogram_thread.join()
+            self.histogram_thread = None
+            if self.thread is None:
+                self.dispatcher.stop()
+        if self.histogram_mode == 'lifetime':
+            self._tear_down_lifetime(*self.histogram_channels)
+        elif self.histogram_mode == 'hbt':
+            self._tear_down_hbt(*self.histogram_channels)
+        elif self.histogram_mode == 'start-stop':
+            self._tear_down_histogram(*self.histogram_channels)
+        if self.histogram_channels is not None:
+            stop_channel = self.histogram_channels[1]
+            if self.callbacks[stop_channel] is None:
+                self.enable_channel(stop_channel, False)
+        self.histogram_callback = None
+        self.histogram_channels = None
+
     def _start_loop(self):
         with self.mutex:
             self.active_channels += 1
             if self.thread is None:
+                self.dispatcher.start()
                 self.thread = Thread(target=self._loop)
                 self._stop = False
                 self.thread.start()
@@ -119,47 +524,232 @@ class QuTAGController:
                 self._stop = True
                 self.thread.join()
                 self.thread = None
+                if self.histogram_thread is None:
+                    self.dispatcher.stop()
+
+    def _histogram_loop(self):
+        # lifetime curves and correlations accumulate on the device,
+        # start-stop histograms and counters start anew at every read
+        mode = self.histogram_mode
+        merge = add_frames if mode in ('start-stop', 'counters') \
+            else newest_frame
+        timer = self.stage_timer
+        last_update = next_poll = time.time()
+        while not self._histogram_stop.wait(max(next_poll - time.time(), 0)):
+            next_poll += self.histogram_interval
+            mark = timer.mark()
+            if mode == 'lifetime':
+                frame = self._get_lifetime()
+            elif mode == 'hbt':
+                frame = self._get_hbt()
+            elif mode == 'counters':
+                frame = self._get_counters()
+                if frame is None:
+                    continue
+            else:
+                frame = (self._get_histogram(),)
+            mark = timer.lap('read', mark)
+            now = time.time()
+            self.dispatcher.submit(self.histogram_callback,
+                                   frame + (now - last_update,), merge=merge,
+                                   max_latency=self.histogram_interval)
+            timer.lap('submit', mark)
+            last_update = now
 
     def _loop(self):
+        self.acquisition_statistics.reset()
+        self.stage_timer.reset()
+        timer = self.stage_timer
         while not self._stop:
-            timestamps, channels, valid = self._get_time_stamps()
-            now = time.time()
-            for timestamp,channel in zip(timestamps[:valid], channels[:valid]):
-                if channel and self.channel_zero_as_start[channel]:
-                    timestamp -= self.last_channel_zero
-                if self.callbacks[channel]:
-                    self.timestamps[channel].append(timestamp)
-                if not channel:
-                    self.last_channel_zero = timestamp
+            timestamps, channels, now, mark = self._poll()
+            self._demux(np.asarray(timestamps), np.asarray(channels))
+            mark = timer.lap('demux', mark)
 
             for channel,next_update in enumerate(self.next_updates):
                 if next_update is None or now < next_update \
                    or self.callbacks[channel] is None:
                     continue
-                self.callbacks[channel](self.timestamps[channel],
-                                        now - self.last_updates[channel])
-                self.timestamps[channel] = []
+                self.dispatcher.submit(
+                    self.callbacks[channel],
+                    (self.timestamps[channel].view().copy(),
+                     now - self.last_updates[channel]),
+                    merge=merge_frames,
+                    max_latency=self.update_intervals[channel])
+                self.timestamps[channel].clear()
                 self.last_updates[channel] = now
                 self.next_updates[channel] = \
                     now + self.update_intervals[channel]
+            timer.lap('submit', mark)
 
-    def _get_time_stamps(self):
-        """Read time stamps from device.
-        Returns tuple (timestamps, channels, valid)."""
+            self.poll_scheduler.sleep(self.next_updates)
 
-        return self.qutag.getLastTimestamps(reset=True)
+    def _demux(self, timestamps, channels):
+        """Split a batch of events into the per-channel stores.
+        Channels using channel 0 as start get the time relative to the last
+        preceding channel 0 event, possibly carried over from the previous
+        batch."""
+
+        if not len(timestamps):
+            return
+        zero_idx = np.flatnonzero(channels == 0)
+
+        for channel in range(9):
+            if self.callbacks[channel] is None:
+                continue
+            idx = np.flatnonzero(channels == channel)
+            if not len(idx):
+                continue
+            events = timestamps[idx]
+            if channel and self.channel_zero_as_start[channel]:
+                starts = self.last_channel_zero
+                if len(zero_idx):
+                    # position of the last channel 0 event before each event
+                    last_zero = np.searchsorted(zero_idx, idx) - 1
+                    starts = np.where(last_zero >= 0,
+                                      timestamps[zero_idx[last_zero]], starts)
+                events = events - starts
+            self.timestamps[channel].extend(events)
+
+        if len(zero_idx):
+            self.last_channel_zero = timestamps[zero_idx[-1]]
+
+    def _set_up_histogram(self, start_channel, stop_channel, bin_width,
+                          bin_count):
+        """Configure the device histogram, bin_width in timebase units."""
+
+        self.qutag.setHistogramParams(bin_width, bin_count)
+        self.qutag.addHistogram(start_channel, stop_channel, True)
+        self.qutag.clearAllHistograms()
+
+    def _tear_down_histogram(self, start_channel, stop_channel):
+        self.qutag.addHistogram(start_channel, stop_channel, False)
+        self.qutag.enableStartStop(False)
+
+    def _get_histogram(self):
+        """Read and reset the device histogram. Returns the bin counts."""
+
+        counts, count, too_small, too_large, starts, stops, exposure = \
+            self.qutag.getHistogram(*self.histogram_channels, True)
+        # the wrapper reuses its result arrays, frames need their own copy
+        return counts.copy()
+
+    def _set_up_counters(self, exposure_time, coincidence_window):
+        """Configure the device counters, exposure_time in ms,
+        coincidence_window in timebase units."""
+
+        self.counter_exposure = exposure_time * 1e-3
+        self.qutag.setExposureTime(exposure_time)
+        self.qutag.setCoincidenceWindow(coincidence_window)
+
+    def _get_counters(self):
+        """Returns (counters, exposure time) if an exposure has completed
+        since the last call, else None."""
+
+        # the device holds the counts of the latest exposure only, even if
+        # several have completed since the last call
+        counters, updates = self.qutag.getCoincCounters()
+        if not updates:
+            return None
+        return counters.copy(), self.counter_exposure
+
+    def _set_up_lifetime(self, start_channel, stop_channel, bin_width,
+                         bin_count):
+        """Configure device lifetime histograms, bin_width in timebase
+        units."""
+
+        self.qutag.enableLFT(True)
+        self.qutag.setLFTParams(bin_width, bin_count)
+        self.qutag.setLFTStartInput(start_channel)
+        self.qutag.addLFTHistogram(stop_channel, True)
+        self.qutag.resetLFTHistograms()
+        self.lft_function = self.qutag.createLFTFunction()
+
+    def _tear_down_lifetime(self, start_channel, stop_channel):
+        self.qutag.addLFTHistogram(stop_channel, False)
+        self.qutag.enableLFT(False)
+        self.qutag.releaseLFTFunction(self.lft_function)
+        self.lft_function = None
+
+    def _get_lifetime(self):
+        """Read the accumulated lifetime histogram and fit it if asked for.
+        Returns (curve, fit parameters or None)."""
+
+        self.qutag.getLFTHistogram(self.histogram_channels[1], False,
+                                   self.lft_function)
+        # the struct is refilled by the next poll, frames need their own copy
+        curve = self.qutag.getLFTFunctionValues(self.lft_function).copy()
+        bin_width = self.lft_function.contents.binWidth
+        if not self.lifetime_fit:
+            return curve, None
+
+        # start from the last fit while it is usable
+        start_params = self.lifetime_params
+        if start_params is None or not np.all(np.isfinite(start_params)):
+            start_params = self._lifetime_start_params(curve, bin_width)
+        self.lifetime_params, iterations = \
+            self.qutag.fitLFTHistogram(self.lft_function, self.lifetime_fit,
+                                       start_params)
+        return curve, self.lifetime_params.copy()
+
+    def _set_up_hbt(self, channel1, channel2, bin_width, bin_count):
+        """Configure the device correlator, bin_width in timebase units."""
+
+        self.qutag.enableHBT(True)
+        self.qutag.setHBTParams(bin_width, bin_count)
+        self.qutag.setHBTInput(channel1, channel2)
+        self.qutag.resetHBTCorrelations()
+        self.hbt_function = self.qutag.createHBTFunction()
+
+    def _tear_down_hbt(self, channel1, channel2):
+        self.qutag.enableHBT(False)
+        self.qutag.releaseHBTFunction(self.hbt_function)
+        self.hbt_function = None
+
+    def _get_hbt(self):
+        """Read the accumulated correlations as g2 and fit them if asked
+        for. Returns (g2, fit parameters or None)."""
+
+        self.qutag.getHBTCorrelations(1, self.hbt_function)
+        self.qutag.calcHBTG2(self.hbt_function)
+        g2 = self.qutag.getHBTFunctionValues(self.hbt_function).copy()
+        if not self.hbt_fit:
+            return g2, None
+
+        start_params = self.hbt_params
+        if start_params is None or not np.all(np.isfinite(start_params)):
+            start_params = self.qutag.getHBTFitStartParams(self.hbt_fit,
+                                                           self.hbt_function)
+        self.hbt_params, iterations = \
+            self.qutag.fitHBTG2(self.hbt_function, self.hbt_fit, start_params)
+        return g2, self.hbt_params.copy()
+
+    @staticmethod
+    def _lifetime_start_params(curve, bin_width):
+        """Rough fit start values: amplitude, mean decay time (timebase
+        units) and offset."""
+
+        offset = curve.min()
+        excess = curve - offset
+        times = np.arange(len(curve)) * bin_width
+        decay = np.dot(excess, times) / excess.sum() if excess.sum() \
+            else bin_width
+        return [excess.max(), decay, offset]
 
 
 class MockQuTAGController(QuTAGController):
+    """Simulated quTAG. Timestamps are int64 counts of timebase since
+    open_communication, rates are given per second, lifetimes in seconds."""
 
     def open_communication(self):
         self.initialised = True
+        self.start_time = time.time()
         self._enabled = [True for _ in range(9)]
         self.rates = [1e4 for _ in range(9)]
         self.rates[0] = 1e3
         self.lifetimes = [0 for _ in range(9)]
         self.backgrounds = [0 for _ in range(9)]
         self.last_timestamp = [None for _ in range(9)]
+        self.last_background = [None for _ in range(9)]
         self.external_trigger = False
         self.zero_as_start = False
 
@@ -168,31 +758,66 @@ class MockQuTAGController(QuTAGController):
             self.stop_tagging()
             self.initialised = False
 
+    def has_feature(self, feature):
+        return True # emulated on the host
+
     def is_enabled(self, channel):
         return self._enabled[channel]
 
     def enable_channel(self, channel, enable):
         self._enabled[channel] = enable
 
+    def _get_data_lost(self):
+        return 0
+
+    def _set_device_buffer_size(self, size):
+        pass
+
+    def current_time(self):
+        """Time since open_communication in units of timebase."""
+
+        return int((time.time() - self.start_time) / self.timebase)
+
     @classmethod
     def make_events(cls, t, to_time, rate):
         """Generate events according to Poisson distribution.
-        Includes starting event at time==t."""
-
-        events = []
-        while t < to_time:
-            events.append(t)
-            t -= np.log(1.0 - random.random()) / rate
-        return events, t
+        Includes starting event at time==t. Times are in units of timebase,
+        the rate is per second.
+        Returns int64 array of the events before to_time and the time of
+        the next event."""
+
+        t = int(t)
+        if rate <= 0 or t >= to_time:
+            return np.empty(0, dtype=np.int64), t
+        mean_interval = 1 / (rate * cls.timebase)
+        chunks = []
+        while True:
+            # cumulated exponential intervals, a few more than expected
+            n = int((to_time - t) / mean_interval * 1.1) + 16
+            intervals = np.random.exponential(mean_interval, n)
+            times = t + np.concatenate(([0], np.cumsum(intervals)))\
+                .astype(np.int64)
+            n_before = np.searchsorted(times, to_time)
+            if n_before < len(times):
+                chunks.append(times[:n_before])
+                return np.concatenate(chunks), int(times[n_before])
+            chunks.append(times[:-1])
+            t = int(times[-1])
 
     @classmethod
     def make_exp_events(cls, triggers, rate, lifetime):
-        events = []
-        events_per_trigger = rate * (triggers[-1] - triggers[0]) / len(triggers)
-        events = \
-            [t + np.random.exponential(lifetime)
-             for i in range(np.random.poisson(events_per_trigger))
-             for t in triggers]
+        """Generate exponentially delayed events after triggers, rate per
+        second, lifetime in seconds. Returns sorted int64 array."""
+
+        triggers = np.asarray(triggers, dtype=np.int64)
+        if not len(triggers):
+            return np.empty(0, dtype=np.int64)
+        events_per_trigger = \
+            rate * cls.timebase * (triggers[-1] - triggers[0]) / len(triggers)
+        n_events = np.random.poisson(events_per_trigger)
+        delays = np.random.exponential(lifetime / cls.timebase,
+                                       n_events * len(triggers))
+        events = np.tile(triggers, n_events) + delays.astype(np.int64)
         events.sort()
         return events
 
@@ -200,113 +825,346 @@ class MockQuTAGController(QuTAGController):
         """Fill self.last_timestamp[channel] with nows and start recording."""
 
         assert channel > 0 and channel < 9
-        self.last_timestamp[channel] = time.time()
+        now = self.current_time()
+        self.last_timestamp[channel] = now
+        self.last_background[channel] = now
         self.zero_as_start |= channel_zero_as_start
         if channel_zero_as_start and self.last_timestamp[0] is None:
-            self.last_timestamp[0] = time.time()
+            self.last_timestamp[0] = now
             self.external_trigger = True
         super().start(channel, callback, channel_zero_as_start, update_interval)
 
     def start_rate_zero(self, callback, update_interval):
-        self.last_timestamp[0] = time.time()
+        self.last_timestamp[0] = self.current_time()
         super().start_rate_zero(callback, update_interval)
 
+    def _set_up_histogram(self, start_channel, stop_channel, bin_width,
+                          bin_count):
+        """Emulate the device histogram on the host. Start events come at
+        rates[start_channel], stop events follow them with the lifetime of
+        stop_channel if set, else at their own rate, plus background."""
+
+        self.histogram_params = (bin_width, bin_count)
+        now = self.current_time()
+        self.histogram_clocks = [now, now, now] # start, stop, background
+        self.last_histogram_start = None
+
+    def _tear_down_histogram(self, start_channel, stop_channel):
+        pass
+
+    def _set_up_lifetime(self, start_channel, stop_channel, bin_width,
+                         bin_count):
+        """Emulate device lifetime histograms by accumulating the emulated
+        start-stop histogram."""
+
+        self._set_up_histogram(start_channel, stop_channel, bin_width,
+                               bin_count)
+        self.lifetime_counts = np.zeros(bin_count)
+
+    def _tear_down_lifetime(self, start_channel, stop_channel):
+        pass
+
+    def _get_lifetime(self):
+        """All fit models are emulated by a single exponential."""
+
+        self.lifetime_counts += self._get_histogram()
+        curve = self.lifetime_counts.copy()
+        if not self.lifetime_fit:
+            return curve, None
+        return curve, self.fit_exponential(curve, self.histogram_params[0])
+
+    def _set_up_hbt(self, channel1, channel2, bin_width, bin_count):
+        """Emulate the device correlator by synthetic antibunching data:
+        coincidences of Poisson streams at rates[channel1] and
+        rates[channel2] with a dip of lifetimes[channel2] (none if 0)."""
+
+        self.histogram_params = (bin_width, bin_count)
+        self.hbt_counts = np.zeros(2 * bin_count - 1)
+        self.hbt_exposure = 0
+        self.last_hbt_time = self.current_time()
+
+    def _tear_down_hbt(self, channel1, channel2):
+        pass
+
+    def counter_combinations(self):
+        return coincidence_combinations()
+
+    def _set_up_counters(self, exposure_time, coincidence_window):
+        """Emulate the device counters: singles of the enabled inputs at
+        their rates. Coincidences are not emulated and stay 0."""
+
+        self.counter_exposure = exposure_time * 1e-3
+        self.next_exposure = time.time() + self.counter_exposure
+
+    def _get_counters(self):
+        if time.time() < self.next_exposure:
+            return None
+        self.next_exposure += self.counter_exposure
+        counters = np.zeros(59, dtype=np.int32)
+        for channel in range(9):
+            if self._enabled[channel]:
+                counters[channel] = \
+                    np.random.poisson(self.rates[channel]
+                                      * self.counter_exposure)
+        return counters, self.counter_exposure
+
+    def _get_hbt(self):
+        """All fit models are emulated by an exponential fit of the dip."""
+
+        channel1, channel2 = self.histogram_channels
+        bin_width, bin_count = self.histogram_params
+        now = self.current_time()
+        exposure = (now - self.last_hbt_time) * self.timebase
+        self.last_hbt_time = now
+
+        # expected coincidences per bin for uncorrelated streams
+        flat = self.rates[channel1] * self.rates[channel2] * exposure \
+            * bin_width * self.timebase
+        delays = np.abs(np.arange(1 - bin_count, bin_count)) * bin_width
+        shape = np.ones(len(delays))
+        if self.lifetimes[channel2]:
+            shape -= np.exp(-delays * self.timebase / self.lifetimes[channel2])
+        self.hbt_counts += np.random.poisson(flat * shape)
+        self.hbt_exposure += exposure
+
+        norm = self.rates[channel1] * self.rates[channel2] \
+            * self.hbt_exposure * bin_width * self.timebase
+        g2 = self.hbt_counts / norm if norm else self.hbt_counts.copy()
+        if not self.hbt_fit:
+            return g2, None
+        dip = self.fit_exponential(1 - g2[bin_count - 1:], bin_width)
+        return g2, np.append(dip, 0)
+
+    @staticmethod
+    def fit_exponential(curve, bin_width):
+        """Fit amplitude * exp(-t / decay) + offset to curve, the offset
+        being the mean of the last tenth of the curve. Returns the array
+        (amplitude, decay, offset, 0) with decay in units of timebase."""
+
+        times = np.arange(len(curve)) * bin_width
+        offset = curve[-max(len(curve) // 10, 1):].mean()
+        excess = curve - offset
+        use = excess > 0
+        if use.sum() < 2:
+            return np.array([0, np.nan, offset, 0])
+        slope, intercept = np.polyfit(times[use], np.log(excess[use]), 1,
+                                      w=np.sqrt(excess[use]))
+        decay = -1 / slope if slope < 0 else np.inf
+        return np.array([np.exp(intercept), decay, offset, 0])
+
+    def _get_histogram(self):
+        start_channel, stop_channel = self.histogram_channels
+        bin_width, bin_count = self.histogram_params
+        clocks = self.histogram_clocks
+        now = self.current_time()
+        starts, clocks[0] = \
+            self.make_events(clocks[0], now, self.rates[start_channel])
+        if self.lifetimes[stop_channel]:
+            stops = self.make_exp_events(starts, self.rates[stop_channel],
+                                         self.lifetimes[stop_channel])
+        else:
+            stops, clocks[1] = \
+                self.make_events(clocks[1], now, self.rates[stop_channel])
+        background, clocks[2] = \
+            self.make_events(clocks[2], now, self.backgrounds[stop_channel])
+        stops = np.sort(np.concatenate((stops, background)))
+
+        if self.last_histogram_start is not None:
+            starts = np.concatenate(([self.last_histogram_start], starts))
+        if not len(starts):
+            return np.zeros(bin_count, dtype=np.int32)
+        self.last_histogram_start = starts[-1]
+
+        # each stop event is timed against the last start event before it
+        last_start = np.searchsorted(starts, stops, side='right') - 1
+        valid = last_start >= 0
+        bins = (stops[valid] - starts[last_start[valid]]) // bin_width
+        return np.bincount(bins[bins < bin_count], minlength=bin_count)\
+            .astype(np.int32)
+
     def _get_time_stamps(self):
-        """Generate events since self.last_timestamp[channel]."""
+        """Generate events since self.last_timestamp[channel].
+        Returns tuple (timestamps, channels, valid) in time order."""
 
-        now = time.time()
+        now = self.current_time()
+        triggers = np.empty(0, dtype=np.int64)
         if self.external_trigger or self.callbacks[0]:
             if self.external_trigger:
-                dt = 1 / self.rates[0]
-                n = int((now - self.last_timestamp[0]) / dt + 1)
-                timestamps = [self.last_timestamp[0] + i * dt for i in range(n)]
+                dt = int(1 / (self.rates[0] * self.timebase))
+                n = (now - self.last_timestamp[0]) // dt + 1
+                triggers = \
+                    self.last_timestamp[0] + dt * np.arange(n, dtype=np.int64)
+                self.last_timestamp[0] += n * dt
             else:
-                events, self.last_timestamp[0] = \
+                triggers, self.last_timestamp[0] = \
                     self.make_events(self.last_timestamp[0], now, self.rates[0])
-                timestamps = events
-            self.last_timestamp[0] = timestamps[-1]
-            n_triggers = len(timestamps)
-            channels = [0 for _ in range(n_triggers)]
-        else:
-            timestamps = []
-            channels = []
-            n_triggers = 0
+        timestamps = [triggers]
+        channels = [np.zeros(len(triggers), dtype=np.int8)]
 
         for channel in range(1, 9):
             if self.callbacks[channel] is None:
                 continue
             if self.lifetimes[channel]:
-                events = \
-                    self.make_exp_events(timestamps[:n_triggers],
-                                         self.rates[channel],
-                                         self.lifetimes[channel])
-                background_events, dummy = \
-                    self.make_events(timestamps[0], now,
-                                     self.backgrounds[channel])
+                events = self.make_exp_events(triggers, self.rates[channel],
+                                              self.lifetimes[channel])
             else:
-                lt = self.last_timestamp[channel]
                 events, self.last_timestamp[channel] = \
                     self.make_events(self.last_timestamp[channel], now,
                                      self.rates[channel])
-                background_events, dummy = \
-                    self.make_events(lt, now, self.backgrounds[channel])
-            events += background_events
-            timestamps += events
-            channels += [channel for _ in range(len(events))]
+            background_events, self.last_background[channel] = \
+                self.make_events(self.last_background[channel], now,
+                                 self.backgrounds[channel])
+            timestamps += [events, background_events]
+            channels.append(np.full(len(events) + len(background_events),
+                                    channel, dtype=np.int8))
 
-        # bring lists into time order
-        if len(timestamps):
-            events = list(zip(timestamps, channels))
-            events.sort()
-            timestamps, channels = list(zip(*events))
-            timestamps, channels = list(timestamps), list(channels)
+        # bring events into time order
+        timestamps = np.concatenate(timestamps)
+        channels = np.concatenate(channels)
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], channels[order], len(timestamps)
 
-        time.sleep(0.01) # don't go too fast
-        return timestamps, channels, len(channels)
 
+class ReplayQuTAGController(QuTAGController):
+    """Replay timestamps recorded with start_recording, as if they came
+    from the device. .npy recordings are memory mapped and served as views
+    without copying, HDF5 recordings are read in slices.
 
-class TAQuTAGController:
+    With real_time, every poll returns the events recorded in the time
+    elapsed since the last one, else batches of buffer_size events as fast
+    as they are polled. With loop, replay starts over at the end of the
+    recording."""
 
-    def __init__(self):
-        self.initialised = False
-        self.thread = None
-        self.callback = None
-        self.mutex = Lock()
+    real_time = True
+    loop = False
 
     def open_communication(self):
-        try:
-            self.qutag = QuTAG(buf_size=1000)
-            self.initialised = True
-        except:
-            raise RuntimeError("Couldn't initialise QuTAG")
+        self.initialised = True
+        self._enabled = [True for _ in range(9)]
+        self.replay_timestamps = np.empty(0, dtype=np.int64)
+        self.replay_channels = np.empty(0, dtype=np.int8)
+        self.position = 0
+        self._replay_file = None
 
     def close_communication(self):
-        if self.initialised:
-            self.stop_tagging()
-            self.qutag.deInitialize()
-            self.initialised = False
+        self.close_file()
+        self.initialised = False
 
-    def is_enabled(self, channel):
-        """Return True if channel is enabled.
-        0: start, 1:-8 normal channels."""
+    def has_feature(self, feature):
+        return False
+
+    def open_file(self, path):
+        """Open a recording: an .h5/.hdf5 file or any of the .npy files
+        <base>.timestamps.npy, <base>.channels.npy, <base>.timebase.npy."""
+
+        self.close_file()
+        if path.endswith('.h5') or path.endswith('.hdf5'):
+            import h5py # optional dependency, only needed for this format
+            self._replay_file = h5py.File(path, 'r')
+            self.replay_timestamps = self._replay_file['timestamps']
+            self.replay_channels = self._replay_file['channels']
+            self.timebase = self._replay_file.attrs.get('timebase',
+                                                        self.timebase)
+        else:
+            base = npy_base(path)
+            self.replay_timestamps = np.load(base + '.timestamps.npy',
+                                             mmap_mode='r')
+            self.replay_channels = np.load(base + '.channels.npy',
+                                           mmap_mode='r')
+            # recordings without stored timebase are taken to be in ps
+            timebase = base + '.timebase.npy'
+            self.timebase = float(np.load(timebase)) \
+                if os.path.exists(timebase) else 1e-12
+        self.seek(0)
+
+    def close_file(self):
+        if self._replay_file is not None:
+            self._replay_file.close()
+            self._replay_file = None
+        self.replay_timestamps = np.empty(0, dtype=np.int64)
+        self.replay_channels = np.empty(0, dtype=np.int8)
+        self.position = 0
+
+    def seek(self, when):
+        """Continue the replay at when seconds after the first event."""
+
+        if not len(self.replay_timestamps):
+            return
+        first = self.replay_timestamps[0]
+        self.position = self._search(first + int(when / self.timebase))
+        self._synchronise()
 
-        start_enabled, enabled_channels = self.enabled_channels
-        if channel:
-            return enabled_channels[8 - channel] == '1'
-        return start_enabled
+    def is_enabled(self, channel):
+        return self._enabled[channel]
 
     def enable_channel(self, channel, enable):
-        """Enable or disable channel.
-        0: start, 1:-8 normal channels."""
+        self._enabled[channel] = enable
 
-        start_enabled, enabled_channels = self.get_enabled_channels()
+    def _get_data_lost(self):
+        return 0
 
-        if channel:
-            enabled_channels = \
-              replace_char(enabled_channels, 8 - channel, '1' if enable else '0')
+    def _set_device_buffer_size(self, size):
+        pass
+
+    def _search(self, timestamp, start=0):
+        """Index of the first event at or after timestamp, from start on."""
+
+        timestamps = self.replay_timestamps
+        if isinstance(timestamps, np.ndarray):
+            return start + int(np.searchsorted(timestamps[start:], timestamp))
+        # HDF5 dataset: bisect without reading it as a whole
+        low, high = start, len(timestamps)
+        while low < high:
+            middle = (low + high) // 2
+            if timestamps[middle] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _synchronise(self):
+        """Tie the replay clock to the event at the current position."""
+
+        self._clock_start = time.time()
+        self._replay_start = self.replay_timestamps[self.position] \
+            if self.position < len(self.replay_timestamps) else 0
+
+    def _get_time_stamps(self):
+        size = len(self.replay_timestamps)
+        if self.position >= size:
+            if not self.loop or not size:
+                return self.replay_timestamps[:0], self.replay_channels[:0], 0
+            self.position = 0
+            self._synchronise()
+
+        if self.real_time:
+            now = self._replay_start \
+                + int((time.time() - self._clock_start) / self.timebase)
+            end = min(self._search(now + 1, self.position),
+                      self.position + self.buffer_size)
         else:
-            start_enabled = enable
-        self.qutag.enableChannels(start_enabled, enabled_channels)
+            end = min(self.position + self.buffer_size, size)
+        start, self.position = self.position, end
+        return self.replay_timestamps[start:end], \
+            self.replay_channels[start:end], end - start
+
+
+class TAQuTAGController(BaseQuTAGController):
+
+    timed_stages = ['read', 'record', 'pairing', 'submit', 'latency',
+                    'callback']
+
+    def __init__(self):
+        super().__init__()
+        self.callback = None
+        self.pairing_window = None
+
+    def set_pairing_window(self, window):
+        """Time in seconds after a trigger within which its excitation and
+        probe events have to arrive. None or 0: up to the next trigger.
+        Takes effect at the next start."""
+
+        self.pairing_window = window or None
 
     def start(self, excitation_channel, probe_channel, callback,
               update_interval):
@@ -317,6 +1175,7 @@ class TAQuTAGController:
             self.probe_channel = probe_channel
             self.callback = callback
             self.update_interval = update_interval
+            self.dispatcher.start()
             self.thread = Thread(target=self._loop)
             self._stop = False
             self.thread.start()
@@ -330,59 +1189,62 @@ class TAQuTAGController:
             self._stop = True
             self.thread.join()
             self.thread = None
+            self.dispatcher.stop()
             self.callback = None
 
+    def stop_tagging(self):
+        self.stop()
+
     def _loop(self):
-        excitation, probe = [], []
+        excitation = TimestampBuffer(self.max_stored_events,
+                                     dtype=self.timestamp_dtype)
+        probe = TimestampBuffer(self.max_stored_events,
+                                dtype=self.timestamp_dtype)
+        window = None
+        if self.pairing_window:
+            window = int(round(self.pairing_window / self.timebase))
+        pairing = TriggerPairing(self.excitation_channel, self.probe_channel,
+                                 window)
         next_update = time.time() + self.update_interval
-        probe_laser = None
-        excitation_laser = None
-        excitation_trigger = None
+        self.acquisition_statistics.reset()
+        self.stage_timer.reset()
+        timer = self.stage_timer
         while not self._stop:
-            timestamps, channels, valid = self._get_time_stamps()
-            now = time.time()
-            for timestamp,channel in zip(timestamps[:valid], channels[:valid]):
-                if not channel:
-                    excitation_trigger = timestamp
-                    continue
-                if excitation_trigger is None:
-                    continue
-                if channel == self.excitation_channel:
-                    excitation_laser = timestamp - excitation_trigger
-                elif channel == self.probe_channel:
-                    if probe_laser is None:
-                        probe_laser = timestamp - excitation_trigger
-                    else:
-                        continue
-
-                if excitation_laser is None or probe_laser is None:
-                    continue
-
-                excitation.append(excitation_laser)
-                probe.append(probe_laser)
-                probe_laser = None
-                excitation_laser = None
-                excitation_trigger = None
+            timestamps, channels, now, mark = self._poll()
+            batch_excitation, batch_probe = pairing.add(timestamps, channels)
+            excitation.extend(batch_excitation)
+            probe.extend(batch_probe)
+            mark = timer.lap('pairing', mark)
 
             if now > next_update and len(excitation):
-                self.callback(excitation, probe)
-                excitation, probe = [], []
+                self.dispatcher.submit(
+                    self.callback,
+                    (excitation.view().copy(), probe.view().copy()),
+                    merge=merge_frames, max_latency=self.update_interval)
+                excitation.clear()
+                probe.clear()
                 next_update = now + self.update_interval
+            timer.lap('submit', mark)
 
-    def _get_time_stamps(self):
-        """Read time stamps from device.
-        Returns tuple (timestamps, channels, valid)."""
-
-        return self.qutag.getLastTimestamps(reset=True)
+            self.poll_scheduler.sleep([next_update])
 
 
 class MockTAQuTAGController(TAQuTAGController):
+    """Simulated pump-probe experiment: per trigger period, probe_pulses
+    probe pulses (channel 2), one excitation pulse (channel 1) and the
+    trigger (channel 0) at excitation_trigger after the period start.
+    Timestamps are int64 counts of timebase since open_communication,
+    trigger_rate is per second, laser delays and jitter are in seconds."""
+
+    timebase = 1e-12
+    probe_pulses = 2
+    probe_jitter = 50e-12
+    excitation_trigger = 0
 
     def open_communication(self):
         self.start_time = time.time()
         self.initialised = True
-        self.scheduled_timestamps = []
-        self.scheduled_channels = []
+        self._reset_schedule()
 
     def close_communication(self):
         if self.initialised:
@@ -390,54 +1252,74 @@ class MockTAQuTAGController(TAQuTAGController):
             self.initialised = False
 
     def current_time(self):
-        return time.time() - self.start_time
+        """Time since open_communication in units of timebase."""
 
+        return int((time.time() - self.start_time) / self.timebase)
 
-    @classmethod
-    def _get_pulse(cls, when, jitter):
-        return when + np.random.normal(0, jitter)
+    def _get_data_lost(self):
+        return 0
 
-    def _get_excitation(self, trigger):
-        return self._get_pulse(trigger + self.excitation_laser,
-                               self.excitation_jitter)
-        
-    def _get_probe(self, trigger):
-        return self._get_pulse(trigger + self.probe_laser, 50e-12)
+    def _set_device_buffer_size(self, size):
+        pass
 
-    def _schedule_item(self, trigger):
-        excitation = self._get_excitation(trigger)
-        probe1 = self._get_probe(trigger)
-        probe2 = self._get_probe(trigger + self.dt / 2)
-
-        if excitation > probe2:
-            self.scheduled_timestamps += [probe1, trigger, probe2, excitation]
-            self.scheduled_channels += [2, 0, 2, 1]
-        else:
-            self.scheduled_timestamps += [probe1, trigger, excitation, probe2]
-            self.scheduled_channels += [2, 0, 1, 2]
-
-        self.last_trigger = trigger
+    def start(self, excitation_channel, probe_channel, callback,
+              update_interval):
+        self._reset_schedule()
+        super().start(excitation_channel, probe_channel, callback,
+                      update_interval)
+
+    def _reset_schedule(self):
+        self.last_trigger = None
+        self.scheduled_timestamps = np.empty(0, dtype=np.int64)
+        self.scheduled_channels = np.empty(0, dtype=np.int8)
+
+    def _get_pulses(self, when, jitter):
+        return when + np.random.normal(0, jitter / self.timebase, when.shape)
+
+    def _schedule(self, periods):
+        """Generate the events of the trigger periods starting at periods,
+        in time order."""
+
+        n = len(periods)
+        dt = 1 / (self.trigger_rate * self.timebase)
+        probe_offsets = self.probe_laser / self.timebase \
+            + np.arange(self.probe_pulses) * dt / self.probe_pulses
+        probes = self._get_pulses(periods[:, None] + probe_offsets,
+                                  self.probe_jitter)
+        excitation = self._get_pulses(
+            periods + self.excitation_laser / self.timebase,
+            self.excitation_jitter)
+        triggers = periods + int(self.excitation_trigger / self.timebase)
+
+        timestamps = np.column_stack((probes, excitation, triggers))
+        channels = np.array([2] * self.probe_pulses + [1, 0], dtype=np.int8)
+        order = np.argsort(timestamps, axis=1, kind='stable')
+        timestamps = np.take_along_axis(timestamps, order, 1)
+        return timestamps.astype(np.int64).ravel(), channels[order].ravel()
 
     def _get_time_stamps(self):
         now = self.current_time()
-        if not hasattr(self, 'dt'):
-            self.dt = 1 / self.trigger_rate
-        if not hasattr(self, 'last_trigger'):
-            self.last_trigger = now - self.dt
-            self._schedule_item(now)
-
-        timestamps, channels = [], []
-
-        while self.scheduled_timestamps[0] <= now:
-            timestamp = self.scheduled_timestamps[0]
-            channel = self.scheduled_channels[0]
-            timestamps.append(timestamp)
-            channels.append(channel)
-            del self.scheduled_timestamps[0]
-            del self.scheduled_channels[0]
-
-            if not len(self.scheduled_timestamps):
-                self._schedule_item(self.last_trigger + self.dt)
-
-        time.sleep(0.01) # don't go too fast
-        return timestamps, channels, len(channels)
+        dt = 1 / (self.trigger_rate * self.timebase)
+        if self.last_trigger is None:
+            self.last_trigger = now - dt
+
+        # schedule all trigger periods which have started by now
+        n_periods = int((now - self.last_trigger) // dt)
+        if n_periods > 0:
+            periods = self.last_trigger \
+                + (dt * np.arange(1, n_periods + 1)).astype(np.int64)
+            self.last_trigger = int(periods[-1])
+            timestamps, channels = self._schedule(periods)
+            self.scheduled_timestamps = \
+                np.concatenate((self.scheduled_timestamps, timestamps))
+            self.scheduled_channels = \
+                np.concatenate((self.scheduled_channels, channels))
+
+        # hand out events up to the first one still in the future
+        late = np.flatnonzero(self.scheduled_timestamps > now)
+        n_due = late[0] if len(late) else len(self.scheduled_timestamps)
+        timestamps = self.scheduled_timestamps[:n_due]
+        channels = self.scheduled_channels[:n_due]
+        self.scheduled_timestamps = self.scheduled_timestamps[n_due:]
+        self.scheduled_channels = self.scheduled_channels[n_due:]
+        return timestamps, channels, n_due
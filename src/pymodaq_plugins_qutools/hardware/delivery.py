@@ -0,0 +1,161 @@
+import time
+from collections import deque
+from threading import Thread, Condition
+import numpy as np
+
+
+def merge_frames(old_args, new_args):
+    """Coalesce two callback argument tuples: arrays are concatenated,
+    numbers (e.g. elapsed times) are added."""
+
+    return tuple(np.concatenate((old, new)) if isinstance(old, np.ndarray)
+                 else old + new
+                 for old, new in zip(old_args, new_args))
+
+
+def add_frames(old_args, new_args):
+    """Coalesce two callback argument tuples of accumulated data, e.g.
+    histogram counts and their exposure times: all entries are added."""
+
+    return tuple(old + new for old, new in zip(old_args, new_args))
+
+
+def newest_frame(old_args, new_args):
+    """Coalesce two callback argument tuples of snapshots, e.g. curves
+    accumulated on the device: the newer one replaces the older."""
+
+    return new_args
+
+
+class _Frame:
+
+    def __init__(self, callback, args, merge, max_latency):
+        self.callback = callback
+        self.args = args
+        self.merge = merge
+        self.max_latency = max_latency
+        self.submitted = time.time()
+
+
+class CallbackDispatcher:
+    """Deliver callback frames from the acquisition thread to consumers on a
+    worker thread.
+
+    Frames wait in a queue of at most max_size entries. When it is full, a
+    new frame is handled according to policy:
+    'coalesce': merged into the newest queued frame for the same callback,
+                if that frame has a merge function, else like 'drop_oldest'
+    'drop_oldest': the oldest queued frame is discarded
+    'drop_newest': the new frame is discarded
+    'block': the acquisition thread waits until there is room
+
+    The counters queued, dropped, coalesced, delivered and late (frames
+    delivered more than their max_latency after submission) are kept. If a
+    StageTimer is given as timer, the stages 'latency' (submission to
+    delivery) and 'callback' are timed as well."""
+
+    POLICIES = ['coalesce', 'drop_oldest', 'drop_newest', 'block']
+
+    def __init__(self, max_size=8, policy='coalesce'):
+        assert policy in self.POLICIES
+        self.max_size = max_size
+        self.policy = policy
+        self._frames = deque()
+        self._condition = Condition()
+        self._running = False
+        self.thread = None
+        self.timer = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.queued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.delivered = 0
+        self.late = 0
+
+    def start(self):
+        """Start the worker thread and a new set of counters."""
+
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._reset_counters()
+        self.thread = Thread(target=self._run)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the worker thread, discarding frames not yet delivered."""
+
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self.dropped += len(self._frames)
+            self._frames.clear()
+            self._condition.notify_all()
+        self.thread.join()
+        self.thread = None
+
+    def submit(self, callback, args, merge=None, max_latency=None):
+        """Queue callback(*args) for delivery."""
+
+        with self._condition:
+            if len(self._frames) >= self.max_size \
+               and not self._make_room(callback, args):
+                return
+            if not self._running:
+                return
+            self._frames.append(_Frame(callback, args, merge, max_latency))
+            self.queued += 1
+            self._condition.notify_all()
+
+    def statistics(self):
+        with self._condition:
+            return { 'queued': self.queued, 'dropped': self.dropped,
+                     'coalesced': self.coalesced, 'delivered': self.delivered,
+                     'late': self.late, 'pending': len(self._frames) }
+
+    def _make_room(self, callback, args):
+        """Apply the overflow policy to a full queue.
+        Returns True if the new frame still has to be queued."""
+
+        if self.policy == 'block':
+            self._condition.wait_for(
+                lambda: len(self._frames) < self.max_size or not self._running)
+            return True
+        if self.policy == 'drop_newest':
+            self.dropped += 1
+            return False
+        if self.policy == 'coalesce':
+            for frame in reversed(self._frames):
+                if frame.callback == callback and frame.merge is not None:
+                    frame.args = frame.merge(frame.args, args)
+                    self.coalesced += 1
+                    return False
+        self._frames.popleft()
+        self.dropped += 1
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._frames) or not self._running)
+                if not self._running:
+                    return
+                frame = self._frames.popleft()
+                self._condition.notify_all()
+                latency = time.time() - frame.submitted
+                if frame.max_latency is not None \
+                   and latency > frame.max_latency:
+                    self.late += 1
+            timer = self.timer
+            mark = timer.mark() if timer is not None else 0
+            frame.callback(*frame.args)
+            if mark:
+                timer.add('latency', int(latency * 1e9))
+                timer.lap('callback', mark)
+            with self._condition:
+                self.delivered += 1
@@ -0,0 +1,123 @@
+import time
+from threading import Lock
+
+
+class AcquisitionStatistics:
+    """Per session counters of an acquisition loop.
+
+    Every poll adds its batch size. At every check_interval the loop
+    queries the device data-loss flag; the event rate is averaged over the
+    same interval."""
+
+    def __init__(self, buffer_size, check_interval=1.0):
+        self.buffer_size = buffer_size
+        self.check_interval = check_interval
+        self.reset()
+
+    def reset(self, now=None):
+        if now is None:
+            now = time.time()
+        self.session_start = now
+        self.batches = 0
+        self.events = 0
+        self.full_batches = 0
+        self.lost_checks = 0
+        self.max_fill = 0
+        self.window_fill = 0
+        self.events_per_second = 0
+        self._window_max_fill = 0
+        self._window_start = now
+        self._window_events = 0
+        self.next_check = now + self.check_interval
+
+    def add_batch(self, valid):
+        self.batches += 1
+        self.events += valid
+        self._window_events += valid
+        fill = valid / self.buffer_size
+        self.max_fill = max(self.max_fill, fill)
+        self._window_max_fill = max(self._window_max_fill, fill)
+        if fill >= 1:
+            self.full_batches += 1
+
+    def check_due(self, now):
+        return now >= self.next_check
+
+    def add_check(self, data_lost, now):
+        """Record the result of a data-loss query and close the window
+        of events_per_second and window_fill (maximum batch fill)."""
+
+        if data_lost:
+            self.lost_checks += 1
+        self.events_per_second = \
+            self._window_events / max(now - self._window_start, 1e-9)
+        self.window_fill = self._window_max_fill
+        self._window_start = now
+        self._window_events = 0
+        self._window_max_fill = 0
+        self.next_check = now + self.check_interval
+
+    def summary(self):
+        return { 'events/s': self.events_per_second,
+                 'events': self.events,
+                 'batches': self.batches,
+                 'mean batch': self.events / max(self.batches, 1),
+                 'max fill': self.max_fill,
+                 'full batches': self.full_batches,
+                 'data lost': self.lost_checks }
+
+
+class StageTimer:
+    """Optional timing of the stages of an acquisition loop with
+    time.perf_counter_ns.
+
+    A loop takes a mark() and attributes the time up to each following
+    lap() to the named stage. Other threads add their durations directly.
+    While disabled, mark() and lap() return at once and nothing is
+    recorded."""
+
+    def __init__(self, stages, enabled=False):
+        self.stages = list(stages)
+        self.enabled = enabled
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.stages, 0)
+            self._totals = dict.fromkeys(self.stages, 0)
+            self._maxima = dict.fromkeys(self.stages, 0)
+
+    def mark(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def lap(self, stage, since):
+        """Add the time since the mark since to stage.
+        Returns the new mark."""
+
+        if not self.enabled:
+            return 0
+        now = time.perf_counter_ns()
+        if since:
+            self.add(stage, now - since)
+        return now
+
+    def add(self, stage, duration):
+        """Add a duration in ns to stage."""
+
+        with self._lock:
+            self._counts[stage] += 1
+            self._totals[stage] += duration
+            self._maxima[stage] = max(self._maxima[stage], duration)
+
+    def summary(self):
+        """Mean and maximum duration of every stage in seconds."""
+
+        summary = {}
+        with self._lock:
+            for stage in self.stages:
+                count = max(self._counts[stage], 1)
+                summary[f'{stage} mean [s]'] = \
+                    self._totals[stage] / count * 1e-9
+                summary[f'{stage} max [s]'] = self._maxima[stage] * 1e-9
+        return summary
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class TriggerPairing:
+    """Pair each trigger (channel 0) with the first excitation and the first
+    probe event following it.
+
+    An event belongs to a trigger if it arrives before the next trigger and
+    less than window (in timestamp units, None: unlimited) after it. Each
+    channel has to be in time order, as delivered by the device. A trigger
+    whose window is still open at the end of a batch is carried over to the
+    next one together with the first events after it."""
+
+    def __init__(self, excitation_channel, probe_channel, window=None):
+        self.excitation_channel = excitation_channel
+        self.probe_channel = probe_channel
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self._triggers = np.empty(0, dtype=np.int64)
+        self._excitation = np.empty(0, dtype=np.int64)
+        self._probe = np.empty(0, dtype=np.int64)
+
+    def add(self, timestamps, channels):
+        """Pair a batch of events.
+        Returns the aligned arrays of excitation and probe delays with
+        respect to their trigger."""
+
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        channels = np.asarray(channels)
+        triggers = np.concatenate((self._triggers, timestamps[channels == 0]))
+        excitation = np.concatenate(
+            (self._excitation, timestamps[channels == self.excitation_channel]))
+        probe = np.concatenate(
+            (self._probe, timestamps[channels == self.probe_channel]))
+        if not len(triggers):
+            self.reset()
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        ends = np.empty(len(triggers), dtype=np.int64)
+        ends[:-1] = triggers[1:]
+        ends[-1] = np.iinfo(np.int64).max
+        if self.window is not None:
+            ends = np.minimum(ends, triggers + self.window)
+
+        first_excitation, found_excitation = \
+            self._first_after(excitation, triggers, ends)
+        first_probe, found_probe = self._first_after(probe, triggers, ends)
+        paired = found_excitation & found_probe
+
+        # the last trigger stays open unless it is paired or its window has
+        # passed
+        closed = paired[-1] or self.window is not None and len(timestamps) \
+            and timestamps.max() >= ends[-1]
+        if closed:
+            self.reset()
+        else:
+            # later events arrive before any later trigger, only the first
+            # one after the open trigger can be paired
+            self._triggers = triggers[-1:]
+            first = first_excitation[-1]
+            self._excitation = excitation[first:first + 1]
+            first = first_probe[-1]
+            self._probe = probe[first:first + 1]
+            paired[-1] = False
+
+        return excitation[first_excitation[paired]] - triggers[paired], \
+            probe[first_probe[paired]] - triggers[paired]
+
+    @staticmethod
+    def _first_after(events, triggers, ends):
+        """Index of the first event at or after each trigger and whether it
+        lies before the trigger's end."""
+
+        first = np.searchsorted(events, triggers)
+        found = first < len(events)
+        found[found] = events[first[found]] < ends[found]
+        return first, found
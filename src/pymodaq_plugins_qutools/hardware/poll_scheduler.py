@@ -0,0 +1,53 @@
+import time
+
+
+class PollScheduler:
+    """Decide how long an acquisition loop sleeps between two device polls.
+
+    The poll period is sized so that a poll finds the device timestamp
+    buffer filled to about target_fill at the currently observed event
+    rate. It shrinks at once when the rate goes up and at most doubles per
+    poll when it goes down. Sleeping is cut short at the next callback
+    deadline."""
+
+    def __init__(self, buffer_size, target_fill=0.25, min_period=1e-4,
+                 max_period=0.05):
+        self.buffer_size = buffer_size
+        self.target_fill = target_fill
+        self.min_period = min_period
+        self.max_period = max_period
+        self.period = min_period
+        self.fill = 0
+        self.last_poll = None
+
+    def update(self, valid, now=None):
+        """Adapt the poll period to the number of events of the last poll.
+        Returns the new period in seconds."""
+
+        if now is None:
+            now = time.time()
+        self.fill = valid / self.buffer_size
+        if self.last_poll is None or not valid:
+            period = 2 * self.period
+        else:
+            rate = valid / max(now - self.last_poll, 1e-9)
+            period = min(self.target_fill * self.buffer_size / rate,
+                         2 * self.period)
+        self.last_poll = now
+        self.period = min(max(period, self.min_period), self.max_period)
+        return self.period
+
+    def sleep(self, deadlines=()):
+        """Sleep for the poll period or until the earliest of deadlines
+        (time.time() values, None entries are ignored).
+        Returns the time actually slept for."""
+
+        duration = self.period
+        now = time.time()
+        for deadline in deadlines:
+            if deadline is not None:
+                duration = min(duration, deadline - now)
+        if duration > 0:
+            time.sleep(duration)
+            return duration
+        return 0
@@ -1,20 +1,20 @@
 import ctypes, random
 import numpy as np
 from threading import Thread
-from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
+from pymodaq_plugins_qutools.timestamp_buffer import TimestampBuffer
+from pymodaq_plugins_qutools.hardware.poll_scheduler import PollScheduler
+from pymodaq_plugins_qutools.hardware.diagnostics import StageTimer
+from pymodaq_plugins_qutools.hardware.channel_config import \
+    ChannelConfiguration
 
 import time
 
-def replace_char(string, pos, char):
-    return string[:pos] + char + string[pos+1:]
-# Could simply be string[pos] = char. However, in Python some features are
-# just broken by design ;-/
-
 class QuTAGController:
 
     SCOND_LVTTL = 1
     SCOND_NIM   = 2
     SCOND_MISC  = 3
+    timebase = 1e-12 # s, replaced by the device value when connected
      
     def __init__(self):
         self._initialised = False
@@ -25,17 +25,27 @@ class QuTAGController:
         self.events_callback = None
         self.event_channels = None
         self._initialise_events = False
-        self.sample_count = np.zeros(8, dtype=np.int32)
+        self.sample_count = np.zeros(9, dtype=np.int32) # start, channels 1-8
         self.time_tags_per_channel = True
         self.mean_valid = 0
         self.rms_valid = 0
+        self.events_per_second = 0
+        self.buffer_size = 1000
+        self.poll_scheduler = PollScheduler(self.buffer_size)
+        self.stage_timer = StageTimer(['read', 'sort', 'rates callback',
+                                       'events callback'])
+        self.channel_config = ChannelConfiguration()
 
     def __del__(self):
         self.close_communication()
 
     def open_communication(self, update_interval):
+        from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
         try:
-            self.qutag = QuTAG(buf_size=1000)
+            self.qutag = QuTAG(buf_size=self.buffer_size)
+            self.timebase = self.qutag.getTimebase()
+            self.channel_config.qutag = self.qutag
+            self.channel_config.read()
         except:
             raise RuntimeError("Couldn't initialise QuTAG")
         self.update_interval = update_interval
@@ -45,6 +55,7 @@ class QuTAGController:
         if self._initialised:
             self.stop_tagging()
             self.qutag.deInitialize()
+            self.channel_config.qutag = None
             self._initialised = False
 
     @property
@@ -62,61 +73,63 @@ class QuTAGController:
     def set_update_interval(self, interval):
         self.update_interval = interval
 
+    def set_stage_timing(self, enable):
+        """Switch timing of the loop stages on or off, starting with empty
+        timings."""
+
+        self.stage_timer.reset()
+        self.stage_timer.enabled = enable
+
+    def stage_timing(self):
+        """Return mean and maximum duration per loop stage, together with
+        the mean batch size and the event rate of the last polls."""
+
+        timing = self.stage_timer.summary()
+        timing['mean batch'] = self.mean_valid
+        timing['events/s'] = self.events_per_second
+        return timing
+
     @property
     def enabled_channels(self):
         """Return channels which are enabled on the device."""
 
-        start_enabled, enabled_channels = self.qutag.getChannelsEnabled()
-        while len(enabled_channels) < 8:
-            enabled_channels = '0' + enabled_channels
-        return start_enabled, enabled_channels
+        return self.channel_config.is_enabled(0), \
+            self.channel_config.enabled_channels
 
     def get_enabled(self, channel):
         """Return True if channel is enabled.
         0: start, 1:-8 normal channels."""
 
-        start_enabled, enabled_channels = self.enabled_channels
-        if channel:
-            return enabled_channels[8 - channel] == '1'
-        return start_enabled
+        return self.channel_config.is_enabled(channel)
 
     def enable_channel(self, channel, enable):
         """Enable or disable channel.
         0: start, 1:-8 normal channels."""
 
-        start_enabled, enabled_channels = self.get_enabled_channels()
+        self.channel_config.set_enabled(channel, enable)
 
-        if channel:
-            enabled_channels = \
-              replace_char(enabled_channels, 8 - channel, '1' if enable else '0')
-        else:
-            start_enabled = enable
-        self.qutag.enableChannels(start_enabled, enabled_channels)
+    def enable_all_channels(self):
+        with self.channel_config.deferred():
+            for channel in range(9):
+                self.enable_channel(channel, True)
 
     def get_trigger_edge(self, channel):
-        edge, threshold = self.qutag.getSignalConditioning(channel)
-        return edge
+        return self.channel_config.edge_name(channel)
 
     def set_trigger_edge(self, channel, edge):
-        threshold = self.get_trigger_threshold(channel)
-        self.qutag.setSignalConditioning(channel, self.SCOND_MISC, edge,
-                                         threshold)
+        self.channel_config.set_edge(channel, edge)
 
     def get_trigger_threshold(self, channel):
-        edge, threshold = self.qutag.getSignalConditioning(channel)
-        return threshold
+        return self.channel_config.threshold[channel]
 
     def set_trigger_threshold(self, channel, threshold):
-        edge = self.get_trigger_edge(channel)
-        self.qutag.setSignalConditioning(channel, self.SCOND_MISC, edge,
-                                         threshold)
+        self.channel_config.set_threshold(channel, threshold)
 
     def get_signal_conditioning(self, channel):
-        return "Misc"
+        return self.channel_config.conditioning_name(channel)
 
     def set_signal_conditioning(self, channel, cond):
-        edge, threshold = self.qutag.getSignalConditioning(channel)
-        self.qutag.setSignalConditioning(channel, cond, edge, threshold)
+        self.channel_config.set_conditioning(channel, cond)
 
     def start_events(self, channels, callback=None, update_interval=None,
                      time_tags_per_channel=True):
@@ -126,8 +139,9 @@ class QuTAGController:
         self.events_update_interval = update_interval
         self.time_tags_per_channel = time_tags_per_channel
         self.event_channels = channels
-        for channel in channels:
-            self.enable_channel(channel, True)
+        with self.channel_config.deferred():
+            for channel in channels:
+                self.enable_channel(channel, True)
         self._initialise_events = True # flag for the first round in thread loop
         self._start_tagging()
 
@@ -137,8 +151,9 @@ class QuTAGController:
         self.rates_callback = callback
         self.rates_update_interval = update_interval
         self.rate_channels = channels
-        for channel in channels:
-            self.enable_channel(channel, True)
+        with self.channel_config.deferred():
+            for channel in channels:
+                self.enable_channel(channel, True)
         self._initialise_rates = True # flag for the first round in thread loop
         self._start_tagging()
 
@@ -154,17 +169,23 @@ class QuTAGController:
     def _get_time_stamps(self):
         """Read time stamps from device."""
 
-        timestamps, channels, valid = \
-            self.qutag.getLastTimestamps(reset=True)
-        now = time.time()
-        time.sleep(0.01)
-        return timestamps, channels, valid
+        return self.qutag.getLastTimestampsInto(reset=True)
 
     def _get_time_tags(self):
-        """Transform list of tag lists into list of np.arrays."""
+        """Return collected tags in us as list of np.arrays, one per event
+        channel, or as array of (time, channel) rows."""
 
-        time_tags = [np.array(t) for t in self._time_tags]
-        self._time_tags = [[] for _ in range(len(self.event_channels))]
+        # tags are collected as int64 in units of timebase, consumers of
+        # this controller expect us
+        scale = self.timebase * 1e6
+        if self.time_tags_per_channel:
+            time_tags = [t.view() * scale for t in self._time_tags]
+        else:
+            timestamps, channels = self._time_tags
+            time_tags = np.column_stack((timestamps.view() * scale,
+                                         channels.view()))
+        for tags in self._time_tags:
+            tags.clear()
         return time_tags
 
     def _get_rates(self, now):
@@ -172,7 +193,7 @@ class QuTAGController:
 
         dt = now - self.rates_start
         self.rates_start = now
-        data = [np.array([self.sample_count[channel-1] / dt])
+        data = [np.array([self.sample_count[channel] / dt])
                 for channel in self.rate_channels]
         self.sample_count.fill(0)
         return data
@@ -203,14 +224,28 @@ class QuTAGController:
 # thread matter
     def _loop(self):
         self._get_time_stamps() # clear all
+        self.stage_timer.reset()
+        timer = self.stage_timer
+        last_poll = time.time()
         while not self._stop:
             if not self._initialised:
                 return
 
+            mark = timer.mark()
             timestamps, channels, valid = self._get_time_stamps()
+            mark = timer.lap('read', mark)
+            timestamps, channels = timestamps[:valid], channels[:valid]
+            now = time.time()
+            self.poll_scheduler.update(valid, now)
+            # running means over about 100 polls
+            self.mean_valid += 0.01 * (valid - self.mean_valid)
+            self.events_per_second += 0.01 \
+                * (valid / max(now - last_poll, 1e-9) - self.events_per_second)
+            last_poll = now
 
             # initialise at first round if asked for
             if self._initialise_events:
+                self._allocate_events()
                 self._clear_events(now)
                 self._initialise_events = False
 
@@ -218,20 +253,18 @@ class QuTAGController:
                 self._clear_rates(now)
                 self._initialise_rates = False
 
-            for i in range(valid): # loop over all events and add them to the
-                # corresponding tag list
-                channel = channels[i]
-                if self.time_tags_per_channel:
-                    try:
-                        self._time_tags[channel].append(timestamps[i] * 1e-6)
-                    except:
-                        pass # got nothing, ignore channel
-                else:
-                    self._time_tags.append([timestamps[i] * 1e-6, channel])
-                try:
-                    self.sample_count[channels[i]] += 1
-                except:
-                    pass # got nothing, ignore channel
+            # add all events to the corresponding tag lists
+            if self.collecting_events and self.time_tags_per_channel:
+                for time_tags, channel in zip(self._time_tags,
+                                              self.event_channels):
+                    time_tags.extend(timestamps[channels == channel])
+            elif self.collecting_events:
+                self._time_tags[0].extend(timestamps)
+                self._time_tags[1].extend(channels)
+            n_counters = len(self.sample_count)
+            self.sample_count += \
+                np.bincount(channels, minlength=n_counters)[:n_counters]
+            mark = timer.lap('sort', mark)
 
             if self.rates_callback is not None and now > self.next_rates_update:
                 # send rates on due time
@@ -239,6 +272,7 @@ class QuTAGController:
                 if len(rates):
                     self.rates_callback(rates)
                 self._clear_rates(now)
+                mark = timer.lap('rates callback', mark)
 
             if self.events_callback is not None \
                and now > self.next_events_update:
@@ -246,16 +280,36 @@ class QuTAGController:
                 time_tags = self._get_time_tags()
                 self.events_callback(time_tags)
                 self._clear_events(now)
+                timer.lap('events callback', mark)
+
+            self.poll_scheduler.sleep(self._next_updates())
+
+    def _next_updates(self):
+        """Deadlines of the active callbacks."""
+
+        deadlines = []
+        if self.rates_callback is not None:
+            deadlines.append(self.next_rates_update)
+        if self.events_callback is not None:
+            deadlines.append(self.next_events_update)
+        return deadlines
+
+    def _allocate_events(self):
+        """Create the tag buffers for the current event channels, they are
+        reused until the next start_events."""
 
-    def _clear_events(self, now):
         if self.time_tags_per_channel:
-            self._time_tags = [[] for _ in range(len(self.event_channels))]
+            self._time_tags = [TimestampBuffer() for _ in self.event_channels]
         else:
-            self._time_tags = []
+            self._time_tags = (TimestampBuffer(), TimestampBuffer(dtype=np.int8))
+
+    def _clear_events(self, now):
+        for tags in self._time_tags:
+            tags.clear()
         self.next_events_update = now + self.events_update_interval
 
     def _clear_rates(self, now):
-        self.sample_count = np.zeros(len(self.rate_channels))
+        self.sample_count = np.zeros(9) # indexed by device channel
         self.next_rates_update = now + self.rates_update_interval
         self.rates_start = now
 
@@ -303,7 +357,6 @@ class MockQuTAGController(QuTAGController):
         events.sort()
         timestamps, channels = list(zip(*events))
 
-        time.sleep(0.01) # don't go too fast
         return timestamps, channels, len(channels)
 
     def start_rates(self, channels, callback=None, update_interval=None):
@@ -0,0 +1,174 @@
+from collections import deque
+from importlib.util import find_spec
+from threading import Thread, Condition
+import numpy as np
+from pymodaq_utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+
+def npy_base(path):
+    """<base> of the .npy recording files named by path, which may be any
+    of <base>.timestamps.npy, <base>.channels.npy, <base>.timebase.npy or
+    <base> itself, optionally ending in .npy."""
+
+    for suffix in ('.npy', '.timestamps', '.channels', '.timebase'):
+        path = path[:-len(suffix)] if path.endswith(suffix) else path
+    return path
+
+
+class NpyAppender:
+    """Append-only .npy file of a 1D array. The header has a fixed size of
+    128 bytes, so that the final shape can be written in place on close."""
+
+    header_size = 128
+
+    def __init__(self, path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self.file = open(path, 'wb')
+        self._write_header()
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.size += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self._write_header()
+        self.file.close()
+
+    def _write_header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" \
+            % (np.lib.format.dtype_to_descr(self.dtype), self.size)
+        header = header.ljust(self.header_size - 10 - 1) + '\n'
+        self.file.write(np.lib.format.magic(1, 0)
+                        + len(header).to_bytes(2, 'little')
+                        + header.encode('latin1'))
+
+
+class NpyWriter:
+    """Timestamps and channels in <base>.timestamps.npy and
+    <base>.channels.npy, the timebase as 0-d <base>.timebase.npy."""
+
+    def __init__(self, path, timebase):
+        base = npy_base(path)
+        np.save(base + '.timebase.npy', np.float64(timebase))
+        self.timestamps = NpyAppender(base + '.timestamps.npy', np.int64)
+        self.channels = NpyAppender(base + '.channels.npy', np.int8)
+
+    def write(self, timestamps, channels):
+        self.timestamps.append(timestamps)
+        self.channels.append(channels)
+
+    def close(self):
+        self.timestamps.close()
+        self.channels.close()
+
+
+class HDF5Writer:
+    """Timestamps and channels as chunked, compressed, resizable datasets of
+    an HDF5 file. The timebase is stored as attribute."""
+
+    chunk_size = 2**16
+
+    def __init__(self, path, timebase):
+        import h5py # optional dependency, only needed for this format
+        self.file = h5py.File(path, 'w')
+        self.file.attrs['timebase'] = timebase
+        self.timestamps = self._create('timestamps', np.int64)
+        self.channels = self._create('channels', np.int8)
+
+    def _create(self, name, dtype):
+        return self.file.create_dataset(name, shape=(0,), maxshape=(None,),
+                                        dtype=dtype, chunks=(self.chunk_size,),
+                                        compression='gzip',
+                                        compression_opts=1, shuffle=True)
+
+    def write(self, timestamps, channels):
+        for dataset, values in ((self.timestamps, timestamps),
+                                (self.channels, channels)):
+            size = len(dataset)
+            dataset.resize((size + len(values),))
+            dataset[size:] = values
+
+    def close(self):
+        self.file.close()
+
+
+class TimestampRecorder:
+    """Write raw timestamps and channels to disk on a writer thread.
+
+    Batches wait in a queue of at most max_events events. If the writer
+    cannot keep up, new batches are dropped and counted instead of
+    stalling the acquisition. format is 'npy' or, if h5py is installed,
+    'hdf5'."""
+
+    FORMATS = ['npy'] + (['hdf5'] if find_spec('h5py') else [])
+
+    def __init__(self, path, format='npy', timebase=1e-12,
+                 max_events=2**24):
+        assert format in self.FORMATS
+        writer_type = HDF5Writer if format == 'hdf5' else NpyWriter
+        self.writer = writer_type(path, timebase)
+        self.path = path
+        self.max_events = max_events
+        self._batches = deque()
+        self._queued_events = 0
+        self._condition = Condition()
+        self._running = True
+        self.written_events = 0
+        self.dropped_events = 0
+        self.thread = Thread(target=self._run)
+        self.thread.start()
+
+    def write(self, timestamps, channels):
+        """Queue a batch, the arrays are copied."""
+
+        n = len(timestamps)
+        if not n:
+            return
+        with self._condition:
+            if not self._running:
+                return
+            if self._queued_events + n > self.max_events:
+                if not self.dropped_events:
+                    logger.warning(f"recording to {self.path} cannot keep "
+                                   f"up, dropping events")
+                self.dropped_events += n
+                return
+            self._batches.append((np.array(timestamps, dtype=np.int64),
+                                  np.array(channels, dtype=np.int8)))
+            self._queued_events += n
+            self._condition.notify_all()
+
+    def close(self):
+        """Write the queued batches and close the files."""
+
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        self.thread.join()
+        self.writer.close()
+
+    def statistics(self):
+        with self._condition:
+            return { 'written': self.written_events,
+                     'dropped': self.dropped_events,
+                     'pending': self._queued_events }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._batches) or not self._running)
+                if not len(self._batches):
+                    return
+                timestamps, channels = self._batches.popleft()
+            self.writer.write(timestamps, channels)
+            with self._condition:
+                self._queued_events -= len(timestamps)
+                self.written_events += len(timestamps)
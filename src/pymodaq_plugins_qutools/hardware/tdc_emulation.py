@@ -0,0 +1,353 @@
+import ctypes, time
+from ctypes import c_int32, c_int64, c_int8, c_double, POINTER
+import numpy as np
+
+
+def tdc_function(restype, *argtypes):
+    """Mark a method of TDCEmulation as TDC_* function with the given C
+    prototype."""
+
+    def decorate(method):
+        method.prototype = ctypes.CFUNCTYPE(restype, *argtypes)
+        return method
+    return decorate
+
+
+class _Unsupported:
+    """Stand-in for a TDC_* function which is not emulated. Takes the
+    argtypes and restype set by the wrapper, fails when called."""
+
+    def __init__(self, name):
+        self.name = name
+        self.argtypes = None
+        self.restype = None
+
+    def __call__(self, *args):
+        raise NotImplementedError(f"{self.name} is not emulated")
+
+
+class TDCEmulation:
+    """In-process replacement of the tdcbase library for
+    QuTAG(backend=TDCEmulation()).
+
+    Every emulated TDC_* function is a ctypes callback with the prototype of
+    the library function, so that the wrapper code, its argtypes, pointers
+    and byref arguments run exactly as with the device.
+
+    Enabled inputs deliver Poisson events at rates[channel] per second,
+    channel 0 being the start input. With real_time, the event stream
+    follows the clock; otherwise every TDC_getLastTimestamps call finds a
+    full buffer, for load tests. Start-stop histograms are filled from the
+    same stream. The coincidence counters give Poisson singles per exposure,
+    coincidences are not emulated. Lifetime, HBT and file functions are not
+    emulated, the feature checks report lifetime and HBT as unavailable."""
+
+    channel_count = 9 # start and 8 stop inputs
+    timebase = 1e-12
+    counter_count = 59
+
+    def __init__(self, rates=1e5, real_time=True, seed=None):
+        self.rates = np.zeros(self.channel_count)
+        self.rates[:] = rates
+        self.real_time = real_time
+        self.rng = np.random.default_rng(seed)
+        self.start_enabled = 1
+        self.channel_mask = 2**(self.channel_count - 1) - 1
+        self.conditioning = [(3, 1, 0.5) for _ in range(self.channel_count)]
+        self.buffer_size = 1000000
+        self.exposure_time = 100 # ms
+        self.coincidence_window = 1000
+        self.start_stop = False
+        self.histogram_params = (1000, 100000) # bin width, bin count
+        self.histograms = {}
+        self._clear_timestamps()
+        self._time = 0
+        self._clock_start = time.perf_counter()
+        self._counters_start = self._clock_start
+        self._exposures = 0
+
+        # the callbacks replace the methods on the instance and have to be
+        # kept alive as long as it is used
+        for name in dir(type(self)):
+            if name.startswith('TDC_'):
+                method = getattr(self, name)
+                setattr(self, name, method.prototype(method))
+
+    def __getattr__(self, name):
+        if not name.startswith('TDC_'):
+            raise AttributeError(name)
+        function = _Unsupported(name)
+        setattr(self, name, function)
+        return function
+
+    def _clear_timestamps(self):
+        self._timestamps = np.empty(0, dtype=np.int64)
+        self._channels = np.empty(0, dtype=np.int8)
+        self._data_lost = 0
+
+    def _enabled_rates(self):
+        rates = self.rates.copy()
+        rates[0] *= self.start_enabled
+        for channel in range(1, self.channel_count):
+            if not self.channel_mask & 1 << (channel - 1):
+                rates[channel] = 0
+        return rates
+
+    def _advance(self):
+        """Generate the events since the last call and feed them to the
+        timestamp buffer and the histograms."""
+
+        rates = self._enabled_rates()
+        rate = rates.sum()
+        if self.real_time:
+            now = int((time.perf_counter() - self._clock_start)
+                      / self.timebase)
+            if now <= self._time:
+                return
+            n = self.rng.poisson(rate * (now - self._time) * self.timebase)
+        else:
+            if not rate:
+                return
+            n = self.buffer_size
+            now = self._time + int(n / (rate * self.timebase)) + 1
+        if not n:
+            self._time = now
+            return
+        timestamps = self._time \
+            + np.sort(self.rng.integers(0, now - self._time, n))
+        channels = self.rng.choice(self.channel_count, n, p=rates / rate)\
+            .astype(np.int8)
+        self._time = now
+
+        stored = len(self._timestamps) + n
+        if stored > self.buffer_size:
+            self._data_lost = 1
+        self._timestamps = \
+            np.concatenate((self._timestamps, timestamps))[-self.buffer_size:]
+        self._channels = \
+            np.concatenate((self._channels, channels))[-self.buffer_size:]
+        if self.start_stop:
+            for histogram in self.histograms.values():
+                histogram.add(timestamps, channels, *self.histogram_params)
+
+    @tdc_function(c_double)
+    def TDC_getVersion(self):
+        return 1.0
+
+    @tdc_function(c_int32, POINTER(c_double))
+    def TDC_getTimebase(self, timebase):
+        timebase[0] = self.timebase
+        return 0
+
+    @tdc_function(c_int32, c_int32)
+    def TDC_init(self, device):
+        return 0
+
+    @tdc_function(c_int32)
+    def TDC_deInit(self):
+        return 0
+
+    @tdc_function(c_int32)
+    def TDC_getDevType(self):
+        return 1 # DEVTYPE_NONE, simulated device
+
+    @tdc_function(c_int32)
+    def TDC_checkFeatureHbt(self):
+        return 0
+
+    @tdc_function(c_int32)
+    def TDC_checkFeatureLifeTime(self):
+        return 0
+
+    @tdc_function(c_int32)
+    def TDC_getChannelCount(self):
+        return self.channel_count
+
+    @tdc_function(c_int32, c_int32, c_int32)
+    def TDC_enableChannels(self, start, mask):
+        self._advance()
+        self.start_enabled = start
+        self.channel_mask = mask
+        return 0
+
+    @tdc_function(c_int32, POINTER(c_int32), POINTER(c_int32))
+    def TDC_getChannelsEnabled(self, start, mask):
+        start[0] = self.start_enabled
+        mask[0] = self.channel_mask
+        return 0
+
+    @tdc_function(c_int32, c_int32, c_int32, c_int32, c_double)
+    def TDC_configureSignalConditioning(self, channel, conditioning, edge,
+                                       threshold):
+        if not 0 <= channel < self.channel_count:
+            return 10
+        self.conditioning[channel] = (conditioning, edge, threshold)
+        return 0
+
+    @tdc_function(c_int32, c_int32, POINTER(c_int32), POINTER(c_double))
+    def TDC_getSignalConditioning(self, channel, edge, threshold):
+        if not 0 <= channel < self.channel_count:
+            return 10
+        conditioning, edge[0], threshold[0] = self.conditioning[channel]
+        return 0
+
+    @tdc_function(c_int32, c_int32)
+    def TDC_setCoincidenceWindow(self, window):
+        self.coincidence_window = window
+        return 0
+
+    @tdc_function(c_int32, c_int32)
+    def TDC_setExposureTime(self, exposure_time):
+        self.exposure_time = max(exposure_time, 1)
+        self._counters_start = time.perf_counter()
+        self._exposures = 0
+        return 0
+
+    @tdc_function(c_int32, POINTER(c_int32), POINTER(c_int32))
+    def TDC_getDeviceParams(self, window, exposure_time):
+        window[0] = self.coincidence_window
+        exposure_time[0] = self.exposure_time
+        return 0
+
+    @tdc_function(c_int32, c_int32)
+    def TDC_setTimestampBufferSize(self, size):
+        if size < 1:
+            return 10
+        self.buffer_size = size
+        self._clear_timestamps()
+        return 0
+
+    @tdc_function(c_int32, POINTER(c_int32))
+    def TDC_getTimestampBufferSize(self, size):
+        size[0] = self.buffer_size
+        return 0
+
+    @tdc_function(c_int32, POINTER(c_int32))
+    def TDC_getDataLost(self, lost):
+        lost[0] = self._data_lost
+        self._data_lost = 0
+        return 0
+
+    @tdc_function(c_int32, c_int32, POINTER(c_int64), POINTER(c_int8),
+                  POINTER(c_int32))
+    def TDC_getLastTimestamps(self, reset, timestamps, channels, valid):
+        self._advance()
+        n = len(self._timestamps)
+        if n:
+            ctypes.memmove(timestamps, self._timestamps.ctypes.data, n * 8)
+            ctypes.memmove(channels, self._channels.ctypes.data, n)
+        valid[0] = n
+        if reset:
+            self._timestamps = self._timestamps[:0]
+            self._channels = self._channels[:0]
+        return 0
+
+    @tdc_function(c_int32, POINTER(c_int32), POINTER(c_int32))
+    def TDC_getCoincCounters(self, data, update):
+        exposure = self.exposure_time * 1e-3
+        exposures = \
+            int((time.perf_counter() - self._counters_start) / exposure)
+        update[0] = exposures - self._exposures
+        if exposures > self._exposures:
+            self._exposures = exposures
+            counters = np.zeros(self.counter_count, dtype=np.int32)
+            counters[:self.channel_count] = \
+                self.rng.poisson(self._enabled_rates() * exposure)
+            ctypes.memmove(data, counters.ctypes.data, counters.nbytes)
+        return 0
+
+    @tdc_function(c_int32, c_int32)
+    def TDC_enableStartStop(self, enable):
+        self._advance()
+        self.start_stop = bool(enable)
+        return 0
+
+    @tdc_function(c_int32, c_int32, c_int32, c_int32)
+    def TDC_addHistogram(self, start_channel, stop_channel, enable):
+        if enable:
+            self.histograms.setdefault((start_channel, stop_channel),
+                                       _StartStopHistogram(start_channel,
+                                                           stop_channel))
+        else:
+            self.histograms.pop((start_channel, stop_channel), None)
+        return 0
+
+    @tdc_function(c_int32, c_int32, c_int32)
+    def TDC_setHistogramParams(self, bin_width, bin_count):
+        if bin_width < 1 or bin_count < 1:
+            return 10
+        self.histogram_params = (bin_width, bin_count)
+        for histogram in self.histograms.values():
+            histogram.clear()
+        return 0
+
+    @tdc_function(c_int32)
+    def TDC_clearAllHistograms(self):
+        self._advance()
+        for histogram in self.histograms.values():
+            histogram.clear()
+        return 0
+
+    @tdc_function(c_int32, c_int32, c_int32, c_int32, POINTER(c_int32),
+                  POINTER(c_int32), POINTER(c_int32), POINTER(c_int32),
+                  POINTER(c_int32), POINTER(c_int32), POINTER(c_int64))
+    def TDC_getHistogram(self, start_channel, stop_channel, reset, data,
+                         count, too_small, too_large, starts, stops,
+                         exposure_time):
+        histogram = self.histograms.get((start_channel, stop_channel))
+        if histogram is None:
+            return 10
+        self._advance()
+        counts = histogram.counts(self.histogram_params[1])
+        ctypes.memmove(data, counts.ctypes.data, counts.nbytes)
+        count[0] = counts.sum()
+        too_small[0] = 0
+        too_large[0] = histogram.too_large
+        starts[0] = histogram.starts
+        stops[0] = histogram.stops
+        exposure_time[0] = int((time.perf_counter() - histogram.cleared)
+                               * 1e3)
+        if reset:
+            histogram.clear()
+        return 0
+
+
+class _StartStopHistogram:
+    """Delays of stop events to the latest preceding start event."""
+
+    def __init__(self, start_channel, stop_channel):
+        self.start_channel = start_channel
+        self.stop_channel = stop_channel
+        self.last_start = None
+        self.clear()
+
+    def clear(self):
+        self._counts = np.zeros(0, dtype=np.int32)
+        self.too_large = 0
+        self.starts = 0
+        self.stops = 0
+        self.cleared = time.perf_counter()
+
+    def counts(self, bin_count):
+        counts = np.zeros(bin_count, dtype=np.int32)
+        n = min(bin_count, len(self._counts))
+        counts[:n] = self._counts[:n]
+        return counts
+
+    def add(self, timestamps, channels, bin_width, bin_count):
+        starts = timestamps[channels == self.start_channel]
+        stops = timestamps[channels == self.stop_channel]
+        self.starts += len(starts)
+        self.stops += len(stops)
+        if self.last_start is not None:
+            starts = np.concatenate(([self.last_start], starts))
+        if not len(starts):
+            return
+        self.last_start = starts[-1]
+        last = np.searchsorted(starts, stops, side='right') - 1
+        bins = (stops[last >= 0] - starts[last[last >= 0]]) // bin_width
+        self.too_large += np.count_nonzero(bins >= bin_count)
+        counts = np.bincount(bins[bins < bin_count], minlength=bin_count)
+        if len(self._counts) != bin_count:
+            self._counts = np.zeros(bin_count, dtype=np.int32)
+        self._counts += counts.astype(np.int32)
@@ -2,6 +2,12 @@ import numpy as np
 
 
 class Histogram:
+    """Histogram of n_bins equal bins from min_val to max_val, or over the
+    range of an array of values given as min_val.
+
+    Integer limits, e.g. timestamps in device timebase units, give integer
+    bin widths and binning by integer division: max_val is included and no
+    value is converted to float."""
 
     def __init__(self, n_bins, min_val=None, max_val=None):
         assert type(n_bins) == int
@@ -9,9 +15,8 @@ class Histogram:
         self._bins = None
         self._centers = None
         self._samples = 0
+        self._moments = np.zeros(2)
         self._normalised_bins = None
-        self._mean = None
-        self._sigma = None
         if isinstance(min_val, list) or isinstance(min_val, np.ndarray):
             self._set_up(min_val)
         elif min_val is not None:
@@ -22,59 +27,120 @@ class Histogram:
             self._changed = True
 
     def set_up(self, min_val, max_val):
-        if max_val != min_val:
+        self.integer = isinstance(min_val, (int, np.integer)) \
+            and isinstance(max_val, (int, np.integer))
+        if self.integer:
+            self.bin_width = int(max_val - min_val) // self.n_bins + 1
+            self.ranges = \
+                int(min_val) + np.arange(self.n_bins + 1) * self.bin_width
+        elif max_val != min_val:
             self.ranges = np.linspace(min_val, max_val, self.n_bins + 1)
         else:
             self.ranges = np.linspace(min_val - 0.5, max_val + 0.5,
                                       self.n_bins + 1)
         self.bin_width = self.ranges[1] - self.ranges[0]
         self._centers = self.ranges[:-1] + self.bin_width * 0.5
-        self._bins = np.zeros(self.n_bins)
+        self._indices = np.arange(self.n_bins)
         self.start_range = self.ranges[0]
-        self._changed = True
+        self.clear()
 
     def _set_up(self, values):
-        self.set_up(min(values), max(values))
+        values = np.asarray(values)
+        self.set_up(values.min(), values.max())
         self.collect(values)
 
+    def clear(self):
+        """Empty all bins, keeping the binning."""
+
+        self._bins = np.zeros(self.n_bins)
+        self._samples = 0
+        self._moments = np.zeros(2)
+        self._changed = True
+
     def add(self, value):
-        idx = int((value - self.start_range) / self.bin_width)
+        if self.integer:
+            idx = int(value - self.start_range) // self.bin_width
+        else:
+            idx = int((value - self.start_range) / self.bin_width)
         if idx >= 0 and idx < self.n_bins:
             self._bins[idx] += 1
             self._samples += 1
+            self._moments += idx, idx * idx
+            self._changed = True
 
     def collect(self, values):
-        for value in values:
-            self.add(value)
+        """Add an array of values to the existing bins."""
+
+        values = np.asarray(values)
+        if not len(values):
+            return
+        if self.integer and values.dtype.kind in 'iu':
+            idx = (values - self.start_range) // self.bin_width
+        else:
+            # truncating conversion, same binning as add()
+            idx = ((values - self.start_range) / self.bin_width)\
+                .astype(np.int64)
+        idx = idx[(idx >= 0) & (idx < self.n_bins)]
+        counts = np.bincount(idx, minlength=self.n_bins)
+        self._bins += counts
+        self._samples += len(idx)
+        self._moments += np.dot(counts, self._indices), \
+            np.dot(counts, self._indices**2)
+        self._changed = True
+
+    def include(self, min_val, max_val):
+        """Widen the range to cover min_val to max_val. Neighbouring bins
+        are merged, so the counts collected so far are kept."""
+
+        below = max(int(-((min_val - self.start_range) // self.bin_width)), 0)
+        top = int((max_val - self.start_range) // self.bin_width) + 1
+        needed = below + max(top, self.n_bins)
+        merge = -(-needed // self.n_bins)
+        if not below and merge == 1:
+            return
+        idx = (self._indices + below) // merge
+        self._bins = np.bincount(idx, weights=self._bins,
+                                 minlength=self.n_bins)
+        self._moments = np.array([np.dot(self._bins, self._indices),
+                                  np.dot(self._bins, self._indices**2)])
+        self.start_range = self.start_range - below * self.bin_width
+        self.bin_width = self.bin_width * merge
+        self.ranges = \
+            self.start_range + np.arange(self.n_bins + 1) * self.bin_width
+        self._centers = self.ranges[:-1] + self.bin_width * 0.5
+        self._changed = True
 
     @property
     def bins(self):
-        self._update()
         return self._bins
 
-    @property
-    def samples(self):
-        return self._samples
-
     @property
     def centers(self):
-        self._update()
         return self._centers
 
     @property
     def samples(self):
-        self._update()
         return self._samples
 
     @property
     def mean(self):
-        self._update()
-        return self._mean
-    
+        """Mean of the binned values, taken from the running moments."""
+
+        if not self._samples:
+            return np.nan
+        mean_idx = self._moments[0] / self._samples
+        return self.start_range + (mean_idx + 0.5) * self.bin_width
+
     @property
     def sigma(self):
-        self._update()
-        return self._sigma
+        """Standard deviation of the binned values, from the running
+        moments."""
+
+        if not self._samples:
+            return np.nan
+        mean_idx = self._moments[0] / self._samples
+        variance = self._moments[1] / self._samples - mean_idx**2
+        return np.sqrt(max(variance, 0)) * self.bin_width
 
     @property
     def normalised_bins(self):
@@ -86,10 +152,4 @@ class Histogram:
             return
 
         self._normalised_bins = self._bins / (self._samples * self.bin_width)
-        self._mean = \
-            np.dot(self._normalised_bins, self._centers) * self.bin_width
-        self._sigma = \
-            np.sqrt(np.dot(self._normalised_bins,
-                           (self._centers - self._mean)**2)
-                    * self.bin_width)
         self._changed = False
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class TimestampBuffer:
+    """Compact event store for one channel.
+
+    Events are kept in a NumPy ring buffer which grows on demand up to
+    max_size entries. Once full, the oldest events are overwritten and
+    counted in overflows."""
+
+    def __init__(self, max_size=None, initial_size=4096, dtype=np.int64):
+        if max_size is not None:
+            initial_size = min(initial_size, max_size)
+        self.max_size = max_size
+        self.dtype = dtype
+        self._data = np.empty(initial_size, dtype=dtype)
+        self._start = 0
+        self._size = 0
+        self.overflows = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def extend(self, values):
+        """Append an array of events."""
+
+        values = np.asarray(values, dtype=self.dtype)
+        n = len(values)
+        if not n:
+            return
+        if self.max_size is not None and n > self.max_size:
+            self.overflows += n - self.max_size
+            values = values[n - self.max_size:]
+            n = self.max_size
+        if self._size + n > self.capacity:
+            self._grow(self._size + n)
+
+        excess = self._size + n - self.capacity
+        if excess > 0: # full, drop the oldest events
+            self.overflows += excess
+            self._start = (self._start + excess) % self.capacity
+            self._size -= excess
+
+        end = (self._start + self._size) % self.capacity
+        first = min(n, self.capacity - end)
+        self._data[end:end + first] = values[:first]
+        self._data[:n - first] = values[first:]
+        self._size += n
+
+    def view(self):
+        """Return the stored events as a NumPy view in time order.
+        The view is only valid until the buffer is modified."""
+
+        if self._start + self._size > self.capacity:
+            self._linearise()
+        return self._data[self._start:self._start + self._size]
+
+    def clear(self):
+        """Forget all events, keeping the allocated memory."""
+
+        self._start = 0
+        self._size = 0
+
+    def _grow(self, needed):
+        if self.max_size is not None and self.capacity >= self.max_size:
+            return
+        size = max(needed, 2 * self.capacity)
+        if self.max_size is not None:
+            size = min(size, self.max_size)
+        data = np.empty(size, dtype=self.dtype)
+        data[:self._size] = self.view()
+        self._data = data
+        self._start = 0
+
+    def _linearise(self):
+        wrapped = self._start + self._size - self.capacity
+        self._data[:self._size] = \
+            np.concatenate((self._data[self._start:], self._data[:wrapped]))
+        self._start = 0
@@ -0,0 +1,59 @@
+import time
+
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
+
+
+class SizedController(MockQuTAGController):
+    """Mock which remembers the sizes written to the device."""
+
+    def _set_device_buffer_size(self, size):
+        self.device_sizes.append(size)
+
+
+def make_controller(rate):
+    controller = SizedController()
+    controller.device_sizes = []
+    controller.open_communication()
+    controller.acquisition_statistics.events_per_second = rate
+    return controller
+
+
+def test_auto_size_holds_longest_poll_period():
+    controller = make_controller(1e6)
+    controller.poll_scheduler.max_period = 0.05
+    controller.poll_scheduler.target_fill = 0.25
+    controller._auto_size_buffer()
+    # 1e6 events/s * 0.05 s / 0.25 = 2e5 events -> next power of two
+    assert controller.buffer_size == 2**18
+    assert controller.device_sizes == [2**18]
+    assert controller.poll_scheduler.buffer_size == 2**18
+    assert controller.acquisition_statistics.buffer_size == 2**18
+
+
+def test_auto_size_keeps_size_within_factor_two():
+    controller = make_controller(1e6)
+    controller.set_buffer_size(150000)
+    controller._auto_size_buffer()
+    assert controller.buffer_size == 150000
+    assert controller.device_sizes == [150000]
+
+
+def test_auto_size_limits():
+    controller = make_controller(0)
+    controller.set_buffer_size(2**20)
+    controller._auto_size_buffer()
+    assert controller.buffer_size == 1024
+    controller.acquisition_statistics.events_per_second = 1e12
+    controller._auto_size_buffer()
+    assert controller.buffer_size == controller.max_buffer_size
+
+
+def test_size_change_waits_for_the_loop():
+    controller = make_controller(0)
+    controller.start(1, lambda *args: None, False, 0.01)
+    controller.set_buffer_size(5000)
+    time.sleep(0.1)
+    controller.stop(1)
+    assert controller.buffer_size == 5000
+    assert controller._requested_buffer_size is None
+    assert controller.device_sizes == [5000]
@@ -0,0 +1,79 @@
+from pymodaq_plugins_qutools.hardware.channel_config import \
+    ChannelConfiguration
+
+
+class FakeQuTAG:
+    """Records the configuration calls of ChannelConfiguration."""
+
+    def __init__(self):
+        self.calls = []
+
+    def getChannelsEnabled(self):
+        return 1, '00000101'
+
+    def getSignalConditioning(self, channel):
+        return True, 0.5
+
+    def enableChannels(self, start, channels):
+        self.calls.append(('enable', start, channels))
+
+    def setSignalConditioning(self, channel, conditioning, edge, threshold):
+        self.calls.append(('conditioning', channel, conditioning, edge,
+                           threshold))
+
+
+def make_configuration():
+    qutag = FakeQuTAG()
+    configuration = ChannelConfiguration(qutag)
+    configuration.read()
+    return configuration, qutag
+
+
+def test_read():
+    configuration, qutag = make_configuration()
+    assert [configuration.is_enabled(channel) for channel in range(9)] \
+        == [True, True, False, True, False, False, False, False, False]
+    assert configuration.enabled_channels == '00000101'
+    assert configuration.edge_name(1) == 'Rising'
+    assert configuration.threshold[1] == 0.5
+    assert configuration.conditioning_name(1) == 'Misc'
+
+
+def test_only_changes_are_written():
+    configuration, qutag = make_configuration()
+    configuration.set_enabled(1, True)
+    configuration.set_conditioning(1, 'NIM')
+    configuration.set_conditioning(1, 'NIM')
+    configuration.set_enabled(2, True)
+    assert qutag.calls == [('conditioning', 1, 2, True, 0.5),
+                           ('enable', 1, '00000111')]
+
+
+def test_deferred_writes_once():
+    configuration, qutag = make_configuration()
+    with configuration.deferred():
+        configuration.set_conditioning(3, 'LVTTL')
+        configuration.set_edge(3, 'Falling')
+        configuration.set_threshold(3, 1.2)
+        configuration.set_enabled(3, False)
+        configuration.set_enabled(4, True)
+        assert not qutag.calls
+    assert qutag.calls == [('enable', 1, '00001001'),
+                           ('conditioning', 3, 1, False, 1.2)]
+
+
+def test_edge_is_written_with_conditioning():
+    configuration, qutag = make_configuration()
+    configuration.set_edge(1, 'Falling')
+    configuration.set_threshold(1, 0.3)
+    assert qutag.calls == [('conditioning', 1, 3, False, 0.5),
+                           ('conditioning', 1, 3, False, 0.3)]
+
+
+def test_without_device():
+    configuration = ChannelConfiguration()
+    configuration.read()
+    configuration.set_conditioning(0, 'NIM')
+    configuration.set_enabled(8, False)
+    assert configuration.conditioning_name(0) == 'NIM'
+    assert configuration.enabled_channels == '01111111'
@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import \
+    BaseQuTAGController, MockQuTAGController, MockTAQuTAGController
+from pymodaq_plugins_qutools.hardware.delivery import CallbackDispatcher, \
+    merge_frames, add_frames, newest_frame
+
+
+class Consumer:
+    """Callback which blocks until released, to let the queue fill up."""
+
+    def __init__(self):
+        self.frames = []
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+    def __call__(self, *args):
+        self.entered.set()
+        self.release.wait(5)
+        self.frames.append(args)
+
+
+def fill(policy, merge=None, n=6):
+    """Submit n frames to a queue of 2 while the first one is being
+    delivered. Returns the dispatcher statistics and the delivered
+    frames."""
+
+    dispatcher = CallbackDispatcher(max_size=2, policy=policy)
+    consumer = Consumer()
+    dispatcher.start()
+    dispatcher.submit(consumer, (0,), merge=merge)
+    assert consumer.entered.wait(5)
+    for value in range(1, n):
+        dispatcher.submit(consumer, (value,), merge=merge)
+    consumer.release.set()
+    while dispatcher.statistics()['pending']:
+        threading.Event().wait(0.01)
+    dispatcher.stop()
+    return dispatcher.statistics(), [args[0] for args in consumer.frames]
+
+
+def test_merge_functions():
+    merged = merge_frames((np.array([1, 2]), 0.5), (np.array([3]), 0.25))
+    assert list(merged[0]) == [1, 2, 3] and merged[1] == 0.75
+    assert add_frames((np.array([1, 2]), 1), (np.array([3, 4]), 2))[1] == 3
+    assert newest_frame((1,), (2,)) == (2,)
+
+
+def test_drop_oldest():
+    statistics, frames = fill('drop_oldest')
+    assert frames == [0, 4, 5]
+    assert statistics['dropped'] == 3
+
+
+def test_drop_newest():
+    statistics, frames = fill('drop_newest')
+    assert frames == [0, 1, 2]
+    assert statistics['dropped'] == 3
+
+
+def test_coalesce():
+    statistics, frames = fill('coalesce', merge=add_frames)
+    assert frames == [0, 1, 2 + 3 + 4 + 5]
+    assert statistics['coalesced'] == 3
+    assert not statistics['dropped']
+
+
+def test_coalesce_without_merge_drops_oldest():
+    statistics, frames = fill('coalesce')
+    assert frames == [0, 4, 5]
+    assert statistics['dropped'] == 3
+
+
+def test_block():
+    dispatcher = CallbackDispatcher(max_size=2, policy='block')
+    consumer = Consumer()
+    dispatcher.start()
+    producer = threading.Thread(
+        target=lambda: [dispatcher.submit(consumer, (value,))
+                        for value in range(6)])
+    producer.start()
+    assert consumer.entered.wait(5)
+    producer.join(0.2)
+    assert producer.is_alive() # waits for room in the queue
+    consumer.release.set()
+    producer.join(5)
+    while dispatcher.statistics()['pending']:
+        threading.Event().wait(0.01)
+    dispatcher.stop()
+    assert [args[0] for args in consumer.frames] == list(range(6))
+    assert dispatcher.statistics()['delivered'] == 6
+
+
+def test_controllers_implement_stop_tagging():
+    with pytest.raises(TypeError):
+        BaseQuTAGController()
+    for controller in (MockQuTAGController(), MockTAQuTAGController()):
+        controller.stop_tagging()
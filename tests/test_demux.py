@@ -0,0 +1,71 @@
+import numpy as np
+
+from pymodaq_plugins_qutools.hardware.controller import QuTAGController
+
+
+def demux_events(timestamps, channels, channel, zero_as_start, last_zero=0):
+    """Per-event reference of QuTAGController._demux for one channel."""
+
+    events = []
+    for timestamp, event_channel in zip(timestamps, channels):
+        if event_channel == 0:
+            last_zero = timestamp
+        elif event_channel == channel:
+            events.append(timestamp - last_zero if zero_as_start
+                          else timestamp)
+    return events, last_zero
+
+
+def stored(controller, channel):
+    return controller.timestamps[channel].view()
+
+
+def make_controller():
+    controller = QuTAGController()
+    for channel in (0, 1, 2):
+        controller.callbacks[channel] = print
+    controller.channel_zero_as_start[2] = True
+    return controller
+
+
+def make_batch(rng, n):
+    timestamps = np.cumsum(rng.integers(1, 1000, n)).astype(np.int64)
+    channels = rng.integers(0, 4, n).astype(np.int8)
+    return timestamps, channels
+
+
+def test_demux_routes_channels():
+    rng = np.random.default_rng(1)
+    timestamps, channels = make_batch(rng, 1000)
+    controller = make_controller()
+    controller._demux(timestamps, channels)
+
+    assert np.array_equal(stored(controller, 0),
+                          timestamps[channels == 0])
+    assert np.array_equal(stored(controller, 1),
+                          timestamps[channels == 1])
+    expected, last_zero = demux_events(timestamps, channels, 2, True)
+    assert np.array_equal(stored(controller, 2), expected)
+    # channel 3 has no callback
+    assert not len(stored(controller, 3))
+    assert controller.last_channel_zero == last_zero
+
+
+def test_demux_carries_start_over_batches():
+    rng = np.random.default_rng(2)
+    timestamps, channels = make_batch(rng, 1000)
+    controller = make_controller()
+    for batch in np.array_split(np.arange(len(timestamps)), 7):
+        controller._demux(timestamps[batch], channels[batch])
+
+    expected, last_zero = demux_events(timestamps, channels, 2, True)
+    assert np.array_equal(stored(controller, 2), expected)
+
+
+def test_demux_batch_without_start_events():
+    controller = make_controller()
+    controller._demux(np.array([10, 20], dtype=np.int64),
+                      np.array([0, 2], dtype=np.int8))
+    controller._demux(np.array([30, 45], dtype=np.int64),
+                      np.array([2, 2], dtype=np.int8))
+    assert list(stored(controller, 2)) == [10, 20, 35]
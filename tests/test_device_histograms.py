@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import \
+    MockQuTAGController, coincidence_combinations
+
+
+@pytest.fixture
+def controller():
+    np.random.seed(11)
+    controller = MockQuTAGController()
+    controller.open_communication()
+    controller.rates[1] = 1e6
+    controller.rates[2] = 1e6
+    controller.lifetimes[2] = 2e-9
+    yield controller
+    controller.stop_histogram()
+
+
+def acquire(start, duration=0.3):
+    """Run an acquisition started by start(callback) for duration seconds.
+    Returns the delivered frames."""
+
+    frames = []
+    start(lambda *args: frames.append(args))
+    time.sleep(duration)
+    return frames
+
+
+def test_start_stop_histogram(controller):
+    frames = acquire(lambda callback: controller.start_histogram(
+        1, 2, 100e-12, 200, callback, 0.05))
+    controller.stop_histogram()
+    assert len(frames) >= 2
+    counts = sum(frame[0] for frame in frames)
+    assert counts.shape == (200,)
+    assert counts.sum() > 1000
+    # delays decay with a lifetime of 20 bins
+    assert counts[:20].sum() > 2 * counts[20:40].sum() > 0
+    elapsed = sum(frame[1] for frame in frames)
+    assert elapsed == pytest.approx(0.3, abs=0.1)
+
+
+def test_lifetime_accumulates_and_fits(controller):
+    frames = acquire(lambda callback: controller.start_lifetime(
+        1, 2, 100e-12, 200, 1, callback, 0.05))
+    controller.stop_histogram()
+    totals = [frame[0].sum() for frame in frames]
+    assert len(totals) >= 2 and totals == sorted(totals)
+    curve, params, elapsed = frames[-1]
+    assert curve.shape == (200,)
+    # decay time in timebase units
+    assert params[1] * controller.timebase \
+        == pytest.approx(2e-9, rel=0.2)
+
+
+def test_lifetime_without_fit(controller):
+    frames = acquire(lambda callback: controller.start_lifetime(
+        1, 2, 100e-12, 200, 0, callback, 0.05), 0.15)
+    controller.stop_histogram()
+    assert frames and all(params is None for _, params, _ in frames)
+
+
+def test_hbt_dip(controller):
+    controller.rates[1] = controller.rates[2] = 1e7
+    frames = acquire(lambda callback: controller.start_hbt(
+        1, 2, 100e-12, 100, 4, callback, 0.05))
+    controller.stop_histogram()
+    g2, params, elapsed = frames[-1]
+    assert g2.shape == (199,)
+    # antibunching: g2(0) = 0, g2 = 1 far from zero delay
+    assert g2[99] == pytest.approx(0, abs=0.05)
+    assert g2[:20].mean() == pytest.approx(1, rel=0.1)
+    assert params[1] * controller.timebase == pytest.approx(2e-9, rel=0.3)
+
+
+def test_counters(controller):
+    frames = acquire(lambda callback: controller.start_counters(
+        0.05, 1e-9, callback))
+    controller.stop_histogram()
+    assert len(frames) >= 3
+    counters, exposure, elapsed = frames[-1]
+    assert counters.shape == (59,)
+    assert exposure == pytest.approx(0.05)
+    assert counters[1] / exposure == pytest.approx(1e6, rel=0.05)
+    assert counters[0] / exposure == pytest.approx(1e3, rel=0.5)
+
+
+def test_coincidence_combination_order(controller):
+    combinations = coincidence_combinations()
+    # TDC_getCoincCounters: 1/2, 1/3, 2/3, 1/4, ..., 7/8, 1/2/3, 1/2/4, ...
+    assert combinations[:7] == [(1, 2), (1, 3), (2, 3), (1, 4), (2, 4),
+                                (3, 4), (1, 5)]
+    assert combinations[27:32] == [(7, 8), (1, 2, 3), (1, 2, 4), (1, 3, 4),
+                                   (2, 3, 4)]
+    assert len(combinations) == 59 - 9
+    assert controller.counter_combinations() == combinations
+
+
+def test_bin_width_in_device_units(controller):
+    controller.start_histogram(1, 2, 100.4e-12, 200, lambda *args: None, 0.05)
+    controller.stop_histogram()
+    assert controller.histogram_params == (100, 200)
+    assert controller.histogram_bin_width == pytest.approx(100e-12)
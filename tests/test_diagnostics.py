@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
+from pymodaq_plugins_qutools.hardware.qutag_controller import \
+    QuTAGController
+from pymodaq_plugins_qutools.hardware.diagnostics import \
+    AcquisitionStatistics, StageTimer
+
+
+def test_batches_and_fill():
+    statistics = AcquisitionStatistics(100, check_interval=1.0)
+    statistics.reset(now=0.0)
+    for valid in (10, 100, 0, 50):
+        statistics.add_batch(valid)
+    assert statistics.batches == 4
+    assert statistics.events == 160
+    assert statistics.max_fill == 1
+    assert statistics.full_batches == 1
+
+
+def test_data_loss_checks_are_counted_per_interval():
+    statistics = AcquisitionStatistics(100, check_interval=0.5)
+    statistics.reset(now=10.0)
+    assert not statistics.check_due(10.4)
+    assert statistics.check_due(10.5)
+
+    statistics.add_batch(40)
+    statistics.add_check(1, now=10.5)
+    statistics.add_batch(60)
+    statistics.add_check(0, now=11.0)
+    statistics.add_check(1, now=11.5)
+    assert statistics.lost_checks == 2
+    assert statistics.summary()['data lost'] == 2
+    assert statistics.next_check == 12.0
+
+
+def test_rate_is_averaged_over_check_window():
+    statistics = AcquisitionStatistics(1000, check_interval=1.0)
+    statistics.reset(now=0.0)
+    statistics.add_batch(300)
+    statistics.add_batch(200)
+    statistics.add_check(0, now=2.0)
+    assert statistics.events_per_second == pytest.approx(250)
+    statistics.add_check(0, now=3.0)
+    assert statistics.events_per_second == 0
+    # session counters survive the window
+    assert statistics.events == 500
+
+    statistics.reset(now=5.0)
+    assert statistics.events == statistics.lost_checks == 0
+
+
+def test_controller_reports_device_data_loss():
+    controller = MockQuTAGController()
+    controller.open_communication()
+    controller._get_data_lost = lambda: 1
+    controller.set_data_loss_check_interval(0.01)
+    controller.start(1, lambda *args: None, False, 0.02)
+    time.sleep(0.2)
+    controller.stop(1)
+    diagnostics = controller.diagnostics()
+    assert diagnostics['data lost'] >= 5
+    assert diagnostics['events'] > 0
+    assert diagnostics['batches'] >= diagnostics['data lost']
+
+
+def test_stage_timer_disabled_records_nothing():
+    timer = StageTimer(['read', 'submit'])
+    mark = timer.mark()
+    assert mark == 0
+    assert timer.lap('read', mark) == 0
+    assert set(timer.summary().values()) == {0}
+
+
+def test_stage_timer_summary():
+    timer = StageTimer(['read', 'submit'], enabled=True)
+    mark = timer.mark()
+    time.sleep(0.01)
+    mark = timer.lap('read', mark)
+    timer.lap('submit', mark)
+    timer.add('submit', 3_000_000)
+    summary = timer.summary()
+    assert list(summary) == ['read mean [s]', 'read max [s]',
+                             'submit mean [s]', 'submit max [s]']
+    assert 0.01 <= summary['read mean [s]'] == summary['read max [s]'] < 1
+    assert summary['submit max [s]'] >= 3e-3
+    assert summary['submit mean [s]'] < summary['submit max [s]']
+
+    timer.reset()
+    assert set(timer.summary().values()) == {0}
+
+
+def test_controller_times_its_stages():
+    controller = MockQuTAGController()
+    controller.open_communication()
+    controller.set_stage_timing(True)
+    controller.start(1, lambda *args: None, False, 0.02)
+    time.sleep(0.2)
+    controller.stop(1)
+    timing = controller.stage_timing()
+    for stage in ('read', 'demux', 'submit', 'callback'):
+        assert timing[f'{stage} max [s]'] > 0
+        assert timing[f'{stage} mean [s]'] <= timing[f'{stage} max [s]']
+
+
+class FixedQuTAGController(QuTAGController):
+    """Legacy controller reading ten events per poll."""
+
+    def _get_time_stamps(self):
+        return np.arange(10, dtype=np.int64), np.ones(10, dtype=np.int8), 10
+
+
+def test_legacy_statistics_without_stage_timing():
+    controller = FixedQuTAGController()
+    controller._initialised = True
+    controller.start_rates([1], lambda rates: None, 0.02)
+    time.sleep(0.1)
+    controller.stop_rates()
+    controller._initialised = False
+    timing = controller.stage_timing()
+    # only the stage durations depend on set_stage_timing
+    assert timing['mean batch'] > 0 and timing['events/s'] > 0
+    assert timing['read max [s]'] == 0
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.histogram import Histogram
+
+
+def added_one_by_one(histogram, values):
+    for value in values:
+        histogram.add(value)
+    return histogram
+
+
+@pytest.mark.parametrize('min_val, max_val, values', [
+    (0.0, 1.0, np.random.default_rng(1).uniform(-0.1, 1.1, 5000)),
+    (0, 9999, np.random.default_rng(2).integers(-100, 10100, 5000)),
+])
+def test_collect_matches_add(min_val, max_val, values):
+    collected = Histogram(37, min_val, max_val)
+    collected.collect(values[:2000])
+    collected.collect(values[2000:])
+    added = added_one_by_one(Histogram(37, min_val, max_val), values)
+
+    assert np.array_equal(collected.bins, added.bins)
+    assert collected.samples == added.samples
+    assert collected.mean == pytest.approx(added.mean)
+    assert collected.sigma == pytest.approx(added.sigma)
+
+
+def test_integer_range_includes_maximum():
+    timestamps = np.array([0, 5, 99, 100], dtype=np.int64)
+    histogram = Histogram(10, timestamps)
+    assert histogram.integer
+    assert histogram.samples == len(timestamps)
+    assert histogram.bins.sum() == len(timestamps)
+
+
+def test_moments_from_bins():
+    values = np.random.default_rng(3).normal(5, 1, 20000)
+    histogram = Histogram(200, 0.0, 10.0)
+    histogram.collect(values)
+    centers = histogram.centers
+    mean = np.dot(histogram.bins, centers) / histogram.samples
+    assert histogram.mean == pytest.approx(mean)
+    assert histogram.sigma == pytest.approx(
+        np.sqrt(np.dot(histogram.bins, (centers - mean)**2)
+                / histogram.samples))
+
+
+def test_include_merges_bins():
+    first = np.arange(100, 200, dtype=np.int64)
+    histogram = Histogram(10, first)
+    later = np.arange(250, 450, 2, dtype=np.int64)
+    histogram.include(later.min(), later.max())
+    histogram.collect(later)
+    assert histogram.integer and histogram.bin_width == 40
+    assert histogram.samples == len(first) + len(later)
+    # the merged counts equal a histogram over the widened range
+    merged = Histogram(10, 100, 499)
+    merged.collect(np.concatenate((first, later)))
+    assert histogram.bin_width == merged.bin_width
+    assert np.array_equal(histogram.bins, merged.bins)
+    assert histogram.mean == pytest.approx(merged.mean)
+
+
+def test_include_below_the_range():
+    histogram = Histogram(4, 10.0, 14.0)
+    histogram.collect([10.5, 13.5])
+    histogram.include(5.0, 12.0)
+    # five bins below, merged by three
+    assert histogram.start_range == 5.0 and histogram.bin_width == 3.0
+    assert list(histogram.bins) == [0, 1, 1, 0]
+    histogram.include(7.0, 13.0)
+    assert list(histogram.ranges) == [5, 8, 11, 14, 17]
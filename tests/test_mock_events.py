@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import MockQuTAGController
+
+
+@pytest.fixture(autouse=True)
+def seed():
+    np.random.seed(7)
+
+
+def test_poisson_events():
+    timebase = MockQuTAGController.timebase
+    start, end = 1000, 1000 + int(0.5 / timebase)
+    events, next_event = MockQuTAGController.make_events(start, end, 2e5)
+    assert events.dtype == np.int64
+    assert events[0] == start
+    assert events[-1] < end <= next_event
+    assert np.all(np.diff(events) >= 0)
+
+    # 1e5 expected events, 5 sigma
+    assert abs(len(events) - 1e5) < 5 * np.sqrt(1e5)
+    intervals = np.diff(events) * timebase
+    assert intervals.mean() == pytest.approx(5e-6, rel=0.02)
+    assert intervals.std() == pytest.approx(5e-6, rel=0.02)
+
+
+def test_events_continue_at_next_event():
+    first, next_event = MockQuTAGController.make_events(0, 10**9, 1e4)
+    second, _ = MockQuTAGController.make_events(next_event, 2 * 10**9, 1e4)
+    assert second[0] == next_event > first[-1]
+
+
+def test_no_events():
+    events, next_event = MockQuTAGController.make_events(50, 10, 1e4)
+    assert not len(events) and next_event == 50
+    events, _ = MockQuTAGController.make_events(0, 10**9, 0)
+    assert not len(events)
+
+
+def test_exponential_delays():
+    timebase = MockQuTAGController.timebase
+    triggers = np.arange(10000, dtype=np.int64) * int(1e-6 / timebase)
+    events = MockQuTAGController.make_exp_events(triggers, 3e6, 50e-9)
+    assert np.all(np.diff(events) >= 0)
+    # the same Poisson distributed number of events (mean 3) per trigger
+    assert len(events) % len(triggers) == 0
+    assert 0 < len(events) // len(triggers) < 10
+
+    delays = (events - triggers[np.searchsorted(triggers, events,
+                                                side='right') - 1])
+    # lifetime 50 ns, much shorter than the trigger period
+    assert delays.mean() * timebase == pytest.approx(50e-9, rel=0.03)
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import MockTAQuTAGController
+from pymodaq_plugins_qutools.hardware.pairing import TriggerPairing
+
+
+def make_controller():
+    np.random.seed(3)
+    controller = MockTAQuTAGController()
+    controller.open_communication()
+    controller.trigger_rate = 1e4
+    controller.excitation_laser = 30e-6
+    controller.excitation_jitter = 100e-12
+    controller.probe_laser = 4e-6
+    return controller
+
+
+def test_schedule_per_period():
+    controller = make_controller()
+    periods = np.arange(1000, dtype=np.int64) * 10**8
+    timestamps, channels = controller._schedule(periods)
+    assert timestamps.dtype == np.int64
+    assert np.all(np.diff(timestamps) >= 0)
+    # per period two probe pulses, one excitation pulse and the trigger
+    assert list(np.bincount(channels)) == [1000, 1000, 2000]
+
+    excitation = timestamps[channels == 1] - periods
+    assert excitation.mean() == pytest.approx(3e7, abs=20)
+    assert excitation.std() == pytest.approx(100, rel=0.1)
+    probe = (timestamps[channels == 2] - np.repeat(periods, 2)).reshape(-1, 2)
+    assert probe.mean(axis=0) == pytest.approx([4e6, 5.4e7], abs=10)
+
+
+def test_only_due_events_are_handed_out():
+    controller = make_controller()
+    controller._get_time_stamps()
+    # 10 ms later
+    controller.start_time -= 0.01
+    timestamps, channels, valid = controller._get_time_stamps()
+    assert valid == len(timestamps) == len(channels) > 0
+    assert timestamps.max() <= controller.current_time()
+    assert np.all(controller.scheduled_timestamps > timestamps.max())
+
+    controller.start_time -= 0.01
+    later, _, _ = controller._get_time_stamps()
+    assert later.min() > timestamps.max()
+
+
+def test_pairing_recovers_delays():
+    controller = make_controller()
+    controller._get_time_stamps()
+    # 0.1 s later
+    controller.start_time -= 0.1
+    timestamps, channels, _ = controller._get_time_stamps()
+    excitation, probe = TriggerPairing(1, 2).add(timestamps, channels)
+    assert len(excitation) > 500
+    assert np.median(excitation) * controller.timebase \
+        == pytest.approx(30e-6, rel=1e-3)
+    # the first probe pulse after the trigger
+    assert np.median(probe) * controller.timebase \
+        == pytest.approx(4e-6, rel=1e-3)
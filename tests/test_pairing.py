@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.pairing import TriggerPairing
+
+
+def pair_events(timestamps, channels, window=None):
+    """Per-trigger reference of TriggerPairing with excitation channel 1
+    and probe channel 2."""
+
+    triggers = timestamps[channels == 0]
+    excitation, probe = [], []
+    for i, trigger in enumerate(triggers):
+        end = triggers[i + 1] if i + 1 < len(triggers) else np.inf
+        if window is not None:
+            end = min(end, trigger + window)
+        after = (timestamps >= trigger) & (timestamps < end)
+        first_excitation = timestamps[after & (channels == 1)][:1]
+        first_probe = timestamps[after & (channels == 2)][:1]
+        if len(first_excitation) and len(first_probe):
+            excitation.append(first_excitation[0] - trigger)
+            probe.append(first_probe[0] - trigger)
+    return excitation, probe
+
+
+def make_events(n, seed):
+    rng = np.random.default_rng(seed)
+    timestamps = np.cumsum(rng.integers(1, 100, n)).astype(np.int64)
+    channels = rng.choice(3, n, p=[0.2, 0.4, 0.4]).astype(np.int8)
+    return timestamps, channels
+
+
+@pytest.mark.parametrize('window', [None, 150])
+@pytest.mark.parametrize('n_batches', [1, 13, 200])
+def test_batches_pair_like_reference(window, n_batches):
+    timestamps, channels = make_events(2000, n_batches)
+    pairing = TriggerPairing(1, 2, window)
+    excitation, probe = [], []
+    for batch in np.array_split(np.arange(len(timestamps)), n_batches):
+        batch_excitation, batch_probe = \
+            pairing.add(timestamps[batch], channels[batch])
+        excitation += list(batch_excitation)
+        probe += list(batch_probe)
+
+    expected_excitation, expected_probe = \
+        pair_events(timestamps, channels, window)
+    assert excitation == expected_excitation
+    assert probe == expected_probe
+
+
+def test_open_trigger_is_carried_over():
+    pairing = TriggerPairing(1, 2)
+    excitation, probe = pairing.add([100, 110], [0, 1])
+    assert not len(excitation) and not len(probe)
+    excitation, probe = pairing.add([130, 200], [2, 0])
+    assert list(excitation) == [10] and list(probe) == [30]
+
+
+def test_expired_window_closes_trigger():
+    pairing = TriggerPairing(1, 2, window=50)
+    pairing.add([100, 110], [0, 1])
+    excitation, probe = pairing.add([160, 170], [2, 2])
+    assert not len(excitation) and not len(probe)
+    excitation, probe = pairing.add([300, 305, 310], [0, 1, 2])
+    assert list(excitation) == [5] and list(probe) == [10]
+
+
+def test_carry_without_window_is_bounded():
+    pairing = TriggerPairing(1, 2)
+    pairing.add([0], [0])
+    # excitation events only, the probe of the open trigger never comes
+    for start in range(10, 10000, 100):
+        pairing.add(np.arange(start, start + 100, 10), np.ones(10))
+    assert len(pairing._excitation) == 1 and not len(pairing._probe)
+    excitation, probe = pairing.add([20000, 20005], [2, 0])
+    assert list(excitation) == [10] and list(probe) == [20000]
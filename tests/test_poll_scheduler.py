@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from pymodaq_plugins_qutools.hardware.poll_scheduler import PollScheduler
+
+
+def test_empty_polls_back_off_to_max_period():
+    scheduler = PollScheduler(1000, min_period=1e-3, max_period=0.05)
+    periods = [scheduler.update(0, now=t) for t in range(8)]
+    assert periods[:5] == pytest.approx([2e-3, 4e-3, 8e-3, 16e-3, 32e-3])
+    assert periods[5:] == [0.05] * 3
+
+
+def test_rate_increase_shortens_period_at_once():
+    scheduler = PollScheduler(1000, target_fill=0.25, min_period=1e-4,
+                              max_period=0.05)
+    for t in range(10):
+        scheduler.update(0, now=t)
+    assert scheduler.period == 0.05
+    scheduler.update(10, now=10.0)
+    # 1e5 events/s fill 250 events in 2.5 ms
+    assert scheduler.update(100, now=10.001) == pytest.approx(2.5e-3)
+    assert scheduler.fill == 0.1
+
+
+def test_rate_decrease_doubles_period_per_poll():
+    scheduler = PollScheduler(1000, target_fill=0.25, min_period=1e-4,
+                              max_period=0.05)
+    scheduler.update(1, now=0.0)
+    scheduler.update(1000, now=0.001)
+    assert scheduler.period == pytest.approx(2.5e-4)
+    # the rate drops by a factor of 100, the period may only double
+    assert scheduler.update(10, now=0.002) == pytest.approx(5e-4)
+    assert scheduler.update(10, now=0.003) == pytest.approx(1e-3)
+
+
+def test_sleep_is_cut_at_deadline():
+    scheduler = PollScheduler(1000, max_period=1.0)
+    scheduler.period = 1.0
+    start = time.time()
+    slept = scheduler.sleep([None, start + 0.01])
+    assert slept <= 0.01
+    assert time.time() - start < 0.5
+    assert scheduler.sleep([start - 1]) == 0
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import ReplayQuTAGController
+from pymodaq_plugins_qutools.hardware.recorder import TimestampRecorder, \
+    npy_base
+
+
+def record(path, format, timebase, n=10000, n_batches=9):
+    rng = np.random.default_rng(1)
+    timestamps = np.cumsum(rng.integers(1, 1000, n)).astype(np.int64)
+    channels = rng.integers(0, 9, n).astype(np.int8)
+    recorder = TimestampRecorder(str(path), format, timebase)
+    for batch in np.array_split(np.arange(n), n_batches):
+        recorder.write(timestamps[batch], channels[batch])
+    recorder.close()
+    assert recorder.statistics()['written'] == n
+    return timestamps, channels
+
+
+def replay(path, buffer_size=777):
+    controller = ReplayQuTAGController()
+    controller.open_communication()
+    controller.real_time = False
+    controller.set_buffer_size(buffer_size)
+    controller.open_file(str(path))
+    timestamps, channels = [], []
+    while True:
+        batch_timestamps, batch_channels, valid = \
+            controller._get_time_stamps()
+        if not valid:
+            break
+        assert valid <= buffer_size
+        timestamps.append(np.asarray(batch_timestamps[:valid]))
+        channels.append(np.asarray(batch_channels[:valid]))
+    timebase = controller.timebase
+    controller.close_communication()
+    return np.concatenate(timestamps), np.concatenate(channels), timebase
+
+
+@pytest.mark.parametrize('name', ['run.timestamps.npy', 'run.channels.npy',
+                                  'run.timebase.npy', 'run'])
+def test_npy_round_trip(tmp_path, name):
+    timestamps, channels = record(tmp_path / 'run', 'npy', 5e-12)
+    replayed_timestamps, replayed_channels, timebase = \
+        replay(tmp_path / name)
+    assert np.array_equal(replayed_timestamps, timestamps)
+    assert np.array_equal(replayed_channels, channels)
+    assert timebase == 5e-12
+
+
+def test_hdf5_round_trip(tmp_path):
+    pytest.importorskip('h5py')
+    path = tmp_path / 'run.h5'
+    timestamps, channels = record(path, 'hdf5', 5e-12)
+    replayed_timestamps, replayed_channels, timebase = replay(path)
+    assert np.array_equal(replayed_timestamps, timestamps)
+    assert np.array_equal(replayed_channels, channels)
+    assert timebase == 5e-12
+
+
+def test_seek_and_loop(tmp_path):
+    timestamps, channels = record(tmp_path / 'run', 'npy', 1e-12)
+    controller = ReplayQuTAGController()
+    controller.open_communication()
+    controller.real_time = False
+    controller.set_buffer_size(len(timestamps))
+    controller.open_file(str(tmp_path / 'run'))
+    when = (timestamps[5000] - timestamps[0]) * 1e-12
+    controller.seek(when)
+    replayed, _, valid = controller._get_time_stamps()
+    assert np.array_equal(replayed, timestamps[5000:])
+
+    controller.loop = True
+    replayed, _, valid = controller._get_time_stamps()
+    assert np.array_equal(replayed, timestamps)
+    controller.close_communication()
+
+
+@pytest.mark.parametrize('name, base', [('run.npy', 'run'),
+                                        ('run.timestamps.npy', 'run'),
+                                        ('run.2024', 'run.2024')])
+def test_recording_name_maps_like_replay(tmp_path, name, base):
+    timestamps, _ = record(tmp_path / name, 'npy', 1e-12, n_batches=2)
+    assert npy_base(name) == base
+    assert (tmp_path / (base + '.channels.npy')).exists()
+    replayed_timestamps, _, _ = replay(tmp_path / name)
+    assert np.array_equal(replayed_timestamps, timestamps)
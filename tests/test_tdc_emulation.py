@@ -0,0 +1,201 @@
+import ctypes
+import time
+from ctypes import c_double
+
+import numpy as np
+import pytest
+
+from pymodaq_plugins_qutools.hardware.controller import QuTAGController
+from pymodaq_plugins_qutools.hardware.QuTAG_HR import QuTAG
+from pymodaq_plugins_qutools.hardware.tdc_emulation import TDCEmulation
+
+
+def make_qutag(buffer_size=1000, **options):
+    options.setdefault('seed', 5)
+    return QuTAG(buf_size=buffer_size, backend=TDCEmulation(**options))
+
+
+def test_features():
+    qutag = make_qutag()
+    assert qutag.getTimebase() == 1e-12
+    assert not qutag.checkFeatureLifetime()
+    assert not qutag.checkFeatureHBT()
+
+
+def test_last_timestamps_fill_the_buffer():
+    qutag = make_qutag(rates=1e6, real_time=False)
+    timestamps, channels, valid = qutag.getLastTimestamps(True)
+    assert valid == len(timestamps) == 1000
+    assert timestamps.dtype == np.int64 and channels.dtype == np.int8
+    assert np.all(np.diff(timestamps) >= 0)
+    assert set(channels) <= set(range(9))
+
+    later, _, valid = qutag.getLastTimestamps(True)
+    assert valid == 1000 and later[0] >= timestamps[-1]
+
+
+def test_disabled_channels_have_no_events():
+    qutag = make_qutag(rates=1e6, real_time=False)
+    qutag.enableChannels(False, '00000011')
+    timestamps, channels, valid = qutag.getLastTimestamps(True)
+    assert valid == 1000
+    assert set(channels) == {1, 2}
+
+
+def test_last_timestamps_into_caller_buffers():
+    qutag = make_qutag(rates=1e6, real_time=False)
+    timestamps = np.full(1500, -1, dtype=np.int64)
+    channels = np.full(1500, -1, dtype=np.int8)
+    batch, batch_channels, valid = \
+        qutag.getLastTimestampsInto(True, timestamps, channels)
+    assert valid == len(batch) == len(batch_channels) == 1000
+    assert np.shares_memory(batch, timestamps)
+    assert np.all(timestamps[1000:] == -1)
+
+    with pytest.raises(ValueError):
+        qutag.getLastTimestampsInto(True, timestamps[:999], channels)
+
+
+def test_last_timestamps_into_alternating_buffers():
+    qutag = make_qutag(rates=1e6, real_time=False)
+    first, _, _ = qutag.getLastTimestampsInto(True)
+    kept = first.copy()
+    second, _, _ = qutag.getLastTimestampsInto(True)
+    assert not np.shares_memory(first, second)
+    assert np.array_equal(first, kept)
+    third, _, _ = qutag.getLastTimestampsInto(True)
+    assert np.shares_memory(first, third)
+
+
+def test_start_stop_histogram():
+    qutag = make_qutag(rates=1e6)
+    qutag.setHistogramParams(1000, 500)
+    qutag.addHistogram(0, 1, True)
+    qutag.clearAllHistograms()
+    time.sleep(0.05)
+    counts, count, too_small, too_large, starts, stops, exposure = \
+        qutag.getHistogram(0, 1, True)
+    assert counts.shape == (500,)
+    assert count == counts.sum() > 0
+    assert starts > 0 and stops > 0
+    # Poisson delays: 1 us mean, the histogram covers 500 ns
+    assert too_large > 0
+    assert counts[:100].sum() > counts[-100:].sum()
+
+
+def test_counters():
+    qutag = make_qutag(rates=1e5)
+    qutag.setExposureTime(20)
+    time.sleep(0.05)
+    counters, updates = qutag.getCoincCounters()
+    assert counters.shape == (59,)
+    assert updates >= 2
+    # singles per 20 ms exposure, coincidences are not emulated
+    assert counters[1:9] == pytest.approx(2000, rel=0.2)
+    assert not counters[9:].any()
+    _, updates = qutag.getCoincCounters()
+    assert updates == 0
+
+
+@pytest.fixture
+def controller():
+    controller = QuTAGController()
+    controller.backend = TDCEmulation(1e5, seed=6)
+    controller.open_communication()
+    yield controller
+    controller.stop_histogram()
+
+
+def test_controller_without_lifetime_and_hbt(controller):
+    assert not controller.has_feature('lifetime')
+    assert not controller.has_feature('hbt')
+    with pytest.raises(RuntimeError):
+        controller.start_lifetime(1, 2, 1e-9, 100, 0, print, 0.1)
+    with pytest.raises(RuntimeError):
+        controller.start_hbt(1, 2, 1e-9, 100, 0, print, 0.1)
+    assert controller.histogram_callback is None
+    # the emulation does not say which coincidences it counts where
+    assert controller.counter_combinations() is None
+
+
+def test_controller_timestamp_loop(controller):
+    frames = []
+    controller.start(1, lambda *args: frames.append(args), False, 0.02)
+    time.sleep(0.2)
+    controller.stop(1)
+    assert len(frames) >= 3
+    timestamps = np.concatenate([frame[0] for frame in frames])
+    elapsed = sum(frame[1] for frame in frames)
+    assert np.all(np.diff(timestamps) >= 0)
+    assert len(timestamps) / elapsed == pytest.approx(1e5, rel=0.3)
+
+
+def test_controller_histogram_loop(controller):
+    frames = []
+    controller.start_histogram(0, 1, 10e-9, 200,
+                               lambda *args: frames.append(args), 0.02)
+    time.sleep(0.2)
+    controller.stop_histogram()
+    assert len(frames) >= 3
+    counts = sum(frame[0] for frame in frames)
+    assert counts.shape == (200,) and counts.sum() > 0
+
+
+def test_result_arrays_are_reused():
+    qutag = make_qutag(rates=1e6)
+    qutag.setHistogramParams(1000, 500)
+    qutag.addHistogram(0, 1, True)
+    first = qutag.getHistogram(0, 1, True)[0]
+    assert qutag.getHistogram(0, 1, True)[0] is first
+    counters = qutag.getCoincCounters()[0]
+    assert qutag.getCoincCounters()[0] is counters
+
+
+def test_caller_arrays_return_filled_entries():
+    qutag = make_qutag(rates=1e6)
+    qutag.setHistogramParams(1000, 500)
+    qutag.addHistogram(0, 1, True)
+    data = np.full(800, -1, dtype=np.int32)
+    counts = qutag.getHistogram(0, 1, True, data)[0]
+    assert len(counts) == 500 and np.shares_memory(counts, data)
+    assert np.all(data[500:] == -1)
+
+    data = np.full(100, -1, dtype=np.int32)
+    counters = qutag.getCoincCounters(data)[0]
+    assert len(counters) == 59 and np.shares_memory(counters, data)
+    with pytest.raises(ValueError):
+        qutag.getCoincCounters(data[:58])
+
+
+def make_function(struct, capacity, size):
+    """A function struct followed by room for capacity values, as the
+    library allocates it."""
+
+    length = ctypes.sizeof(struct) + (capacity - 1) * ctypes.sizeof(c_double)
+    memory = ctypes.create_string_buffer(length)
+    function = ctypes.cast(memory, ctypes.POINTER(struct))
+    function.contents.capacity = capacity
+    function.contents.size = size
+    return function, memory
+
+
+@pytest.mark.parametrize('struct, get_values', [
+    (QuTAG.TDC_LftFunction, QuTAG.getLFTFunctionValues),
+    (QuTAG.TDC_HbtFunction, QuTAG.getHBTFunctionValues),
+])
+def test_function_values_are_views(struct, get_values):
+    qutag = make_qutag()
+    function, memory = make_function(struct, 10, 7)
+    offset = struct.values.offset
+    values = get_values(qutag, function)
+    assert values.shape == (7,)
+    assert values.ctypes.data == ctypes.addressof(memory) + offset
+
+    # the library refills the struct in place
+    filled = (c_double * 7).from_address(values.ctypes.data)
+    filled[:] = list(range(7))
+    assert list(values) == list(range(7))
+
+    function.contents.size = 11
+    with pytest.raises(ValueError):
+        get_values(qutag, function)
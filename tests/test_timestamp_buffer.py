@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+
+from pymodaq_plugins_qutools.hardware.qutag_controller import \
+    QuTAGController
+from pymodaq_plugins_qutools.timestamp_buffer import TimestampBuffer
+
+
+def test_grows_on_demand():
+    buffer = TimestampBuffer(initial_size=4)
+    buffer.extend(np.arange(10))
+    assert buffer.capacity >= 10
+    assert list(buffer.view()) == list(range(10))
+    assert not buffer.overflows
+
+
+def test_overwrites_oldest_when_full():
+    buffer = TimestampBuffer(max_size=8, initial_size=4)
+    for start in range(0, 20, 3):
+        buffer.extend(np.arange(start, start + 3))
+    assert buffer.capacity == 8
+    assert list(buffer.view()) == list(range(13, 21))
+    assert buffer.overflows == 21 - 8
+
+
+def test_batch_larger_than_buffer():
+    buffer = TimestampBuffer(max_size=5)
+    buffer.extend([1, 2])
+    buffer.extend(np.arange(10, 22))
+    assert list(buffer.view()) == list(range(17, 22))
+    assert buffer.overflows == 14 - 5
+
+
+def test_wrapped_view_is_in_order():
+    buffer = TimestampBuffer(max_size=6)
+    buffer.extend(np.arange(6))
+    buffer.extend([6, 7])
+    assert list(buffer.view()) == [2, 3, 4, 5, 6, 7]
+    buffer.extend([8])
+    assert list(buffer.view()) == [3, 4, 5, 6, 7, 8]
+
+
+def test_clear_keeps_memory():
+    buffer = TimestampBuffer(max_size=6)
+    buffer.extend(np.arange(6))
+    buffer.clear()
+    assert not len(buffer)
+    assert buffer.capacity == 6
+    buffer.extend([1])
+    assert list(buffer.view()) == [1]
+
+
+class FixedQuTAGController(QuTAGController):
+    """Legacy controller reading the same batch on every poll."""
+
+    def _get_time_stamps(self):
+        timestamps = np.arange(0, 10**7, 10**6, dtype=np.int64)
+        return timestamps, np.tile(np.int8([1, 2]), 5), 10
+
+
+def test_legacy_buffers_are_reused():
+    controller = FixedQuTAGController()
+    controller._initialised = True
+    frames, buffers = [], []
+
+    def callback(time_tags):
+        frames.append(time_tags)
+        buffers.append([id(tags) for tags in controller._time_tags])
+
+    controller.start_events([1, 2], callback, 0.02)
+    time.sleep(0.15)
+    controller.stop_events()
+    controller._initialised = False
+    assert len(frames) >= 3
+    assert all(ids == buffers[0] for ids in buffers)
+    # tags in us, events of one update are not handed out again
+    assert list(frames[-1][0][:5]) == [0, 2, 4, 6, 8]
+    assert len(frames[-1][1]) % 5 == 0